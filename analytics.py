@@ -0,0 +1,259 @@
+import argparse
+import json
+
+import numpy as np
+
+from habit_tracker import Habit
+from streaks import date_ordinal
+
+"""
+Cross-Habit Co-Completion Analytics
+
+Encodes every habit's completions as a row of day bits packed into uint64 words, aligned
+on a common first day. Pairwise statistics are then computed for all habits at once with
+vectorised AND and popcount instead of comparing JSON date lists pair by pair:
+
+    - co-occurrence: the number of days on which both habits were completed
+    - Jaccard similarity: co-occurrence / days on which either habit was completed
+    - lagged correlation: the phi coefficient between habit A on day t and habit B on day t + lag
+
+Usage:
+    python analytics.py [--db main.db] [--top 10] [--lags 0,1,7]
+"""
+
+WORD_BITS = 64
+BLOCK_BYTES = 8 << 20  # Upper bound on the temporary AND matrix built per block of rows (cache-sized)
+
+if hasattr(np, 'bitwise_count'):    # NumPy >= 2.0
+    def popcount(words):
+        """
+        Return the number of set bits in each uint64 word.
+        """
+        return np.bitwise_count(words)
+else:
+    _BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def popcount(words):
+        """
+        Return the number of set bits in each uint64 word.
+        """
+        counts = _BYTE_COUNTS[words.view(np.uint8)]
+        return counts.reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def build_bitsets(histories):
+    """
+    Pack each habit's completed dates into a row of day bits.
+
+    Args:
+        histories (dict): Habit name -> list of completed dates as "YYYY-M-D" strings.
+
+    Returns:
+        tuple: The habit names, a (habits x words) uint64 matrix where bit d of a row is
+        set if the habit was completed on day d, the ordinal of day 0 and the number of days.
+    """
+    names = list(histories)
+    ordinals = [np.fromiter((date_ordinal(d) for d in histories[name]), dtype=np.int64) for name in names]
+    non_empty = [o for o in ordinals if o.size]
+    if not non_empty:
+        return names, np.zeros((len(names), 0), dtype=np.uint64), 0, 0
+    origin = int(min(o.min() for o in non_empty))
+    n_days = int(max(o.max() for o in non_empty)) - origin + 1
+    n_words = -(-n_days // WORD_BITS)
+
+    bits = np.zeros((len(names), n_words * WORD_BITS), dtype=np.uint8)
+    for row, days in enumerate(ordinals):
+        bits[row, days - origin] = 1
+    # packbits with little bit order puts day d in bit d % 8 of byte d // 8; on a little-endian
+    # view the bytes of a word are in the same order, so day d ends up in bit d % 64 of word d // 64
+    packed = np.packbits(bits, axis=1, bitorder='little')
+    matrix = packed.view('<u8').astype(np.uint64, copy=False).reshape(len(names), n_words)
+    return names, matrix, origin, n_days
+
+
+def shift_days(matrix, lag):
+    """
+    Shift every row of a bitset matrix so that bit t holds what bit t + lag held before.
+
+    Args:
+        matrix (numpy.ndarray): A (habits x words) uint64 bitset matrix.
+        lag (int): The number of days to shift by (>= 0).
+
+    Returns:
+        numpy.ndarray: The shifted matrix; bits shifted in from beyond the end are zero.
+    """
+    words, bits = divmod(lag, WORD_BITS)
+    shifted = np.zeros_like(matrix)
+    if words >= matrix.shape[1]:
+        return shifted
+    source = matrix[:, words:]
+    shifted[:, :source.shape[1]] = source >> np.uint64(bits)
+    if bits:
+        shifted[:, :source.shape[1] - 1] |= source[:, 1:] << np.uint64(WORD_BITS - bits)
+    return shifted
+
+
+def day_mask(n_words, n_days):
+    """
+    Return a single bitset row with the first n_days bits set.
+    """
+    mask = np.zeros(n_words, dtype=np.uint64)
+    full, rest = divmod(n_days, WORD_BITS)
+    mask[:full] = np.uint64(0xFFFFFFFFFFFFFFFF)
+    if rest:
+        mask[full] = np.uint64((1 << rest) - 1)
+    return mask
+
+
+def co_occurrence(left, right=None):
+    """
+    Count the days on which each pair of habits was completed together.
+
+    Rows are processed in blocks so the temporary (block x habits x words) AND matrix
+    stays below BLOCK_BYTES.
+
+    Args:
+        left (numpy.ndarray): A (habits x words) uint64 bitset matrix.
+        right (numpy.ndarray, optional): A second matrix of the same shape. Defaults to left.
+
+    Returns:
+        numpy.ndarray: A (habits x habits) int64 matrix of shared completion days.
+    """
+    right = left if right is None else right
+    n, n_words = left.shape
+    counts = np.zeros((n, right.shape[0]), dtype=np.int64)
+    if n_words == 0:
+        return counts
+    block = max(1, BLOCK_BYTES // max(1, right.shape[0] * n_words * 8))
+    for start in range(0, n, block):
+        both = left[start:start + block, None, :] & right[None, :, :]
+        counts[start:start + block] = popcount(both).sum(axis=2, dtype=np.int64)
+    return counts
+
+
+def jaccard(shared, totals):
+    """
+    Return the Jaccard similarity of every pair from their shared and individual day counts.
+    """
+    union = totals[:, None] + totals[None, :] - shared
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(union > 0, shared / union, 0.0)
+
+
+def lagged_correlation(matrix, n_days, lag=0):
+    """
+    Return the phi coefficient between habit A on day t and habit B on day t + lag for every pair.
+
+    A positive value means completing A tends to go with completing B (lag days later);
+    a negative value means the two tend to crowd each other out.
+
+    Args:
+        matrix (numpy.ndarray): A (habits x words) uint64 bitset matrix.
+        n_days (int): The number of days covered by the matrix.
+        lag (int): The lag in days (>= 0).
+
+    Returns:
+        numpy.ndarray: A (habits x habits) float matrix, indexed [A, B]. Pairs involving a
+        habit that was completed on every day or on no day get 0.
+    """
+    n = n_days - lag
+    if n <= 0:
+        return np.zeros((matrix.shape[0], matrix.shape[0]))
+    mask = day_mask(matrix.shape[1], n)
+    leading = matrix & mask
+    trailing = shift_days(matrix, lag) & mask
+    both = co_occurrence(leading, trailing).astype(np.float64)
+    count_a = popcount(leading).sum(axis=1, dtype=np.int64).astype(np.float64)
+    count_b = popcount(trailing).sum(axis=1, dtype=np.int64).astype(np.float64)
+    numerator = n * both - count_a[:, None] * count_b[None, :]
+    denominator = np.sqrt((count_a * (n - count_a))[:, None] * (count_b * (n - count_b))[None, :])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, numerator / denominator, 0.0)
+
+
+def top_pairs(names, scores, k=10, largest=True, symmetric=True):
+    """
+    Return the k highest (or lowest) scoring pairs of distinct habits.
+
+    Args:
+        names (list): The habit names, in matrix order.
+        scores (numpy.ndarray): A (habits x habits) score matrix.
+        k (int): The number of pairs to return.
+        largest (bool): Return the highest scores if True, else the lowest.
+        symmetric (bool): If True, only consider each unordered pair once.
+
+    Returns:
+        list: (habit A, habit B, score) tuples, best first.
+    """
+    n = len(names)
+    if symmetric:
+        rows, cols = np.triu_indices(n, k=1)
+    else:
+        rows, cols = np.nonzero(~np.eye(n, dtype=bool))
+    values = scores[rows, cols]
+    if not values.size:
+        return []
+    keyed = -values if largest else values
+    k = min(k, values.size)
+    best = np.argpartition(keyed, k - 1)[:k]
+    best = best[np.argsort(keyed[best], kind='stable')]
+    return [(names[rows[i]], names[cols[i]], float(values[i])) for i in best]
+
+
+def co_completion_report(histories, k=10, lags=(1,)):
+    """
+    Build a top-K report of habits completed together, crowding each other out, and following each other.
+
+    Args:
+        histories (dict): Habit name -> list of completed dates.
+        k (int): The number of pairs per section.
+        lags (iterable): Lags in days for the "followed by" sections.
+
+    Returns:
+        dict: The report, with one list of {"a", "b", "score"} pairs per section.
+    """
+    names, matrix, origin, n_days = build_bitsets(histories)
+    totals = popcount(matrix).sum(axis=1, dtype=np.int64)
+    shared = co_occurrence(matrix)
+    same_day = lagged_correlation(matrix, n_days, 0)
+
+    def as_dicts(pairs):
+        return [{'a': a, 'b': b, 'score': round(score, 4)} for a, b, score in pairs]
+
+    report = {
+        'habits': len(names),
+        'days': n_days,
+        'together': as_dicts(top_pairs(names, jaccard(shared, totals), k)),
+        'crowding_out': as_dicts(top_pairs(names, same_day, k, largest=False)),
+    }
+    for lag in lags:
+        if lag:
+            report[f'followed_by_lag_{lag}'] = as_dicts(
+                top_pairs(names, lagged_correlation(matrix, n_days, lag), k, symmetric=False))
+    return report
+
+
+def load_histories(period=None):
+    """
+    Load every habit's completed dates from the database in bulk.
+
+    Args:
+        period (str, optional): Only load habits with this period.
+
+    Returns:
+        dict: Habit name -> list of completed dates.
+    """
+    return {habit.name: habit.completed_dates for habit in Habit.load_many(period)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report which habits are completed together.")
+    parser.add_argument('--db', default='main.db', help="Database file (default: main.db)")
+    parser.add_argument('--period', choices=['Daily', 'Weekly'], help="Only compare habits with this period")
+    parser.add_argument('--top', type=int, default=10, help="Pairs per section (default: 10)")
+    parser.add_argument('--lags', default='1', help="Comma-separated lags in days (default: 1)")
+    args = parser.parse_args()
+
+    Habit._DB_NAME = args.db
+    report = co_completion_report(load_histories(args.period), args.top, [int(lag) for lag in args.lags.split(',')])
+    print(json.dumps(report, indent=2))
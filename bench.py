@@ -0,0 +1,258 @@
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from db import create_table
+from habit_tracker import Habit
+from sqlstreaks import compute_streaks_sql
+from storage import MemoryBackend, SQLiteBackend
+
+"""
+Habit Tracker Benchmarks
+
+Small, self-contained benchmarks for the storage and tracking code. Each benchmark builds
+its own temporary database, so running them never touches main.db.
+
+Usage:
+    python bench.py <benchmark> [--habits N] [--dates N] [--threads N]
+"""
+
+
+def make_database(path, n_habits, n_dates, start=date(2023, 1, 1)):
+    """
+    Create a database filled with synthetic daily habits.
+
+    Args:
+        path (str): The database file to create.
+        n_habits (int): The number of habits to insert.
+        n_dates (int): The number of consecutive completed dates per habit.
+        start (date): The first completed date.
+    """
+    dates = json.dumps([str(start + timedelta(days=i)) for i in range(n_dates)])
+    with sqlite3.connect(path) as conn:
+        create_table(conn)
+        conn.executemany(
+            '''INSERT INTO habit (name, description, date_and_time_of_creation, period, completed_dates, current_streak, longest_streak) VALUES (?,?,?,?,?,?,?)''',
+            ((f'Habit {i}', f'Synthetic habit {i}', f'{start} 00:00:00', 'Daily', dates, n_dates, n_dates)
+             for i in range(n_habits)))
+        conn.commit()
+
+
+def _measure(build):
+    """
+    Return the objects built by build() together with the memory they retain and the time taken.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    objects = build()
+    elapsed = time.perf_counter() - started
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return objects, retained, elapsed
+
+
+def bench_load_many(n_habits, n_dates):
+    """
+    Compare the memory per habit of Habit instances against HabitRecord instances from load_many().
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        make_database(path, n_habits, n_dates)
+        old_db_name = Habit._DB_NAME
+        Habit._DB_NAME = path
+        try:
+            def build_habits():
+                with sqlite3.connect(path) as conn:
+                    rows = conn.execute("""SELECT name, description, date_and_time_of_creation, period, completed_dates, current_streak, longest_streak FROM habit""").fetchall()
+                return [Habit(name=r[0], description=r[1], date_and_time_of_creation=r[2], period=r[3],
+                              completed_dates=json.loads(r[4]), current_streak=r[5], longest_streak=r[6]) for r in rows]
+
+            results = []
+            habits, retained, elapsed = _measure(build_habits)
+            results.append(('Habit (decoded)', retained, elapsed))
+            del habits
+
+            records, retained, elapsed = _measure(Habit.load_many)
+            results.append(('HabitRecord (encoded)', retained, elapsed))
+            del records
+
+            records, retained, elapsed = _measure(lambda: [r for r in Habit.load_many() if r.completed_dates is not None])
+            results.append(('HabitRecord (decoded)', retained, elapsed))
+            del records
+        finally:
+            Habit._DB_NAME = old_db_name
+
+    print(f"load_many: {n_habits} habits x {n_dates} completed dates")
+    for label, retained, elapsed in results:
+        print(f"  {label:<24} {retained / n_habits:>10.0f} bytes/habit {elapsed * 1000:>10.1f} ms")
+    return results
+
+
+def bench_checkoff(n_threads, n_checkoffs):
+    """
+    Check off one habit from many threads at once and report throughput and lost updates.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        make_database(path, 1, 0)
+        start = date(2000, 1, 1)
+        failures = []
+
+        def check_off(thread_number):
+            habit = Habit(name='Habit 0', completed_dates='[]')
+            habit._DB_NAME = path
+            habit._MAX_RETRIES = 100
+            try:
+                for i in range(n_checkoffs):
+                    habit.mark_complete(str(start + timedelta(days=thread_number * n_checkoffs + i)))
+            except sqlite3.Error as e:
+                failures.append(e)
+
+        threads = [threading.Thread(target=check_off, args=(i,)) for i in range(n_threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        with sqlite3.connect(path) as conn:
+            stored = len(json.loads(conn.execute("SELECT completed_dates FROM habit").fetchone()[0]))
+
+    expected = n_threads * n_checkoffs
+    print(f"checkoff: {n_threads} threads x {n_checkoffs} check-offs")
+    print(f"  {expected / elapsed:>10.0f} check-offs/s")
+    print(f"  {expected - stored:>10} lost updates, {len(failures)} failed threads")
+    return expected / elapsed, expected - stored
+
+
+def bench_storage(n_habits, n_lookups):
+    """
+    Compare streak lookups through the SQLite backend and the in-memory backend.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        make_database(path, n_habits, 30)
+        names = [f'Habit {i % n_habits}' for i in range(n_lookups)]
+        memory = MemoryBackend(path, checkpoint_interval=None)
+        results = []
+        for label, storage in (('SQLite', SQLiteBackend(path)), ('memory', memory)):
+            started = time.perf_counter()
+            for name in names:
+                storage.streaks(name, 'Daily')
+            results.append((f'{label} backend', (time.perf_counter() - started) / n_lookups))
+
+            previous = Habit.use_storage(storage)
+            try:
+                started = time.perf_counter()
+                for name in names:
+                    Habit.load_streaks(name, 'Daily')
+                results.append((f'{label} via Habit', (time.perf_counter() - started) / n_lookups))
+            finally:
+                Habit.use_storage(previous)
+        memory.close()
+
+    print(f"storage: {n_lookups} streak lookups over {n_habits} habits")
+    for label, seconds in results:
+        print(f"  {label:<24} {seconds * 1e6:>10.2f} us/lookup")
+    return results
+
+
+def bench_startup(n_runs):
+    """
+    Compare the wall time of one command run in a fresh process with and without the daemon.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        socket = os.path.join(tmp, 'bench.sock')
+        make_database(path, 100, 30)
+        command = [sys.executable, os.path.join(here, 'client.py'), '--db', path, '--socket', socket, 'streaks', 'Habit 0']
+
+        def median_run(argv):
+            times = []
+            for _ in range(n_runs):
+                started = time.perf_counter()
+                subprocess.run(argv, check=True, stdout=subprocess.DEVNULL, cwd=here)
+                times.append(time.perf_counter() - started)
+            return statistics.median(times)
+
+        results = [('interactive main.py import', median_run([sys.executable, '-c', 'import main'])),
+                   ('client, in-process fallback', median_run(command))]
+        daemon = subprocess.Popen([sys.executable, os.path.join(here, 'daemon.py'), '--db', path, '--socket', socket],
+                                  stdout=subprocess.DEVNULL, cwd=here)
+        try:
+            deadline = time.monotonic() + 10
+            while not os.path.exists(socket) and time.monotonic() < deadline:
+                time.sleep(0.05)
+            results.append(('client, through daemon', median_run(command)))
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    print(f"startup: median of {n_runs} runs")
+    for label, seconds in results:
+        print(f"  {label:<28} {seconds * 1000:>10.1f} ms")
+    return results
+
+
+def bench_streaks_sql(n_habits, n_dates):
+    """
+    Compare recomputing every habit's streaks in Python against the SQL window-function engine.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        make_database(path, n_habits, n_dates)
+        names = [f'Habit {i}' for i in range(n_habits)]
+        old_db_name = Habit._DB_NAME
+        Habit._DB_NAME = path
+        try:
+            started = time.perf_counter()
+            expected = {name: Habit.compute_streak(Habit.load_completed_dates(name, 'Daily'), name, 1) for name in names}
+            python_elapsed = time.perf_counter() - started
+        finally:
+            Habit._DB_NAME = old_db_name
+
+        started = time.perf_counter()
+        streaks = compute_streaks_sql(path)
+        sql_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        compute_streaks_sql(path, names[0])
+        one_elapsed = time.perf_counter() - started
+
+    results = [('Python, per habit', python_elapsed), ('SQL, all habits', sql_elapsed), ('SQL, one habit', one_elapsed)]
+    print(f"streaks_sql: {n_habits} habits x {n_dates} completed dates")
+    for label, seconds in results:
+        print(f"  {label:<24} {seconds * 1000:>10.1f} ms")
+    print(f"  {'results match':<24} {streaks == expected!s:>10}")
+    return results
+
+
+BENCHMARKS = {
+    'load_many': lambda args: bench_load_many(args.habits, args.dates),
+    'checkoff': lambda args: bench_checkoff(args.threads, args.dates),
+    'storage': lambda args: bench_storage(args.habits, 100000),
+    'startup': lambda args: bench_startup(20),
+    'streaks_sql': lambda args: bench_streaks_sql(args.habits, args.dates),
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a habit tracker benchmark.")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--habits', type=int, default=10000, help="Number of synthetic habits")
+    parser.add_argument('--dates', type=int, default=30, help="Completed dates per habit (check-offs per thread)")
+    parser.add_argument('--threads', type=int, default=8, help="Number of concurrent threads")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
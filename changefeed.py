@@ -0,0 +1,171 @@
+import argparse
+import json
+import sqlite3
+
+from habit_tracker import Habit
+
+"""
+Habit Change Feed
+
+Reads the habit_change table that the triggers from db.create_change_feed() fill, so
+downstream consumers only process what changed since their last run instead of
+re-reading the whole habit table.
+
+A consumer registers once, reads batches of changes after its cursor, and acknowledges
+the last sequence number it has processed. Changes that every registered consumer has
+acknowledged are deleted. Nothing is recorded while no consumer is registered, and the
+feed is emptied when the last consumer unregisters.
+
+Usage:
+    python changefeed.py <consumer> [--db main.db] [--batch-size 100] [--ack]
+"""
+
+
+def _connect(db_name):
+    return sqlite3.connect(db_name, timeout=Habit._BUSY_TIMEOUT)
+
+
+def register_consumer(db_name, consumer, from_start=True):
+    """
+    Register a consumer of the change feed. Registering an existing consumer does nothing.
+
+    Args:
+        db_name (str): The database file.
+        consumer (str): The name of the consumer.
+        from_start (bool): Start from the oldest retained change if True, else from the newest one.
+
+    Returns:
+        int: The consumer's cursor.
+    """
+    with _connect(db_name) as conn:
+        cursor = conn.cursor()
+        start = 0 if from_start else "(SELECT COALESCE(MAX(seq), 0) FROM habit_change)"
+        cursor.execute(f"INSERT OR IGNORE INTO change_consumer (consumer, cursor) VALUES (?, {start})", (consumer,))
+        conn.commit()
+        cursor.execute("SELECT cursor FROM change_consumer WHERE consumer = ?", (consumer,))
+        return cursor.fetchone()[0]
+
+
+def unregister_consumer(db_name, consumer):
+    """
+    Remove a consumer so it no longer holds back truncation of the feed.
+
+    Args:
+        db_name (str): The database file.
+        consumer (str): The name of the consumer.
+    """
+    with _connect(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM change_consumer WHERE consumer = ?", (consumer,))
+        _truncate(cursor)
+        conn.commit()
+
+
+def consumer_cursor(db_name, consumer):
+    """
+    Return the last sequence number a consumer has acknowledged.
+
+    Raises:
+        KeyError: If the consumer is not registered.
+    """
+    with _connect(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT cursor FROM change_consumer WHERE consumer = ?", (consumer,))
+        result = cursor.fetchone()
+    if not result:
+        raise KeyError(f"Unknown consumer: {consumer}")
+    return result[0]
+
+
+def read_changes(db_name, since, limit=100):
+    """
+    Read a batch of changes with a sequence number greater than a cursor.
+
+    Args:
+        db_name (str): The database file.
+        since (int): The cursor; only changes after it are returned.
+        limit (int): The maximum number of changes to return.
+
+    Returns:
+        list: Dicts with the keys seq, name, operation, changed_at and data, oldest first.
+    """
+    with _connect(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""SELECT seq, name, operation, changed_at, data FROM habit_change WHERE seq > ? ORDER BY seq LIMIT ?""",
+                       (since, limit))
+        rows = cursor.fetchall()
+    return [{'seq': seq, 'name': name, 'operation': operation, 'changed_at': changed_at,
+             'data': json.loads(data) if data is not None else None}
+            for seq, name, operation, changed_at, data in rows]
+
+
+def iter_batches(db_name, consumer, batch_size=100):
+    """
+    Yield batches of changes after a consumer's cursor until the feed is drained.
+
+    Batches are not acknowledged; call acknowledge() once a batch has been processed.
+    Reading continues from the end of the previous batch, so unacknowledged batches are
+    not returned twice by one call.
+
+    Args:
+        db_name (str): The database file.
+        consumer (str): The name of a registered consumer.
+        batch_size (int): The maximum number of changes per batch.
+
+    Yields:
+        list: A batch of changes, as returned by read_changes().
+    """
+    since = consumer_cursor(db_name, consumer)
+    while True:
+        batch = read_changes(db_name, since, batch_size)
+        if not batch:
+            return
+        yield batch
+        since = batch[-1]['seq']
+
+
+def acknowledge(db_name, consumer, seq):
+    """
+    Move a consumer's cursor forward and drop changes every consumer has acknowledged.
+
+    The cursor never moves backwards, so acknowledging an old batch again is harmless.
+
+    Args:
+        db_name (str): The database file.
+        consumer (str): The name of a registered consumer.
+        seq (int): The sequence number of the last change the consumer has processed.
+
+    Returns:
+        int: The number of changes deleted from the feed.
+    """
+    with _connect(db_name) as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE change_consumer SET cursor = MAX(cursor, ?) WHERE consumer = ?", (seq, consumer))
+        if cursor.rowcount == 0:
+            raise KeyError(f"Unknown consumer: {consumer}")
+        deleted = _truncate(cursor)
+        conn.commit()
+    return deleted
+
+
+def _truncate(cursor):
+    # Without consumers nobody will read the changes, so all of them go
+    cursor.execute("""DELETE FROM habit_change WHERE seq <= (SELECT MIN(cursor) FROM change_consumer)
+                      OR NOT EXISTS (SELECT 1 FROM change_consumer)""")
+    return cursor.rowcount
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Print the habit changes a consumer has not acknowledged yet.")
+    parser.add_argument('consumer', help="Name of the consumer (registered on first use)")
+    parser.add_argument('--db', default='main.db', help="Database file (default: main.db)")
+    parser.add_argument('--batch-size', type=int, default=100, help="Changes read per batch")
+    parser.add_argument('--ack', action='store_true', help="Acknowledge every printed change")
+    args = parser.parse_args()
+
+    register_consumer(args.db, args.consumer)
+    for batch in iter_batches(args.db, args.consumer, args.batch_size):
+        for change in batch:
+            print(json.dumps(change))
+        if args.ack:
+            acknowledge(args.db, args.consumer, batch[-1]['seq'])
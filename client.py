@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import socket
+import sys
+from datetime import date
+
+"""
+Habit Tracker Client
+
+A thin, non-interactive entry point for scripts. Each command is sent as one JSON line to
+the resident daemon (see daemon.py) over a Unix domain socket, so repeated calls skip the
+interpreter work of importing the app and opening the database. If no daemon is running,
+the command is executed in-process instead, with the same result.
+
+Only the standard library is imported until the fallback is needed.
+
+Usage:
+    python client.py [--db main.db] <command> [arguments]
+    python client.py check-off Reading --period Daily
+"""
+
+
+class CommandError(Exception):
+    """
+    Raised when the daemon reports that a command failed.
+    """
+
+
+def check_date(value):
+    """
+    Check that a completed date is a "YYYY-MM-DD" date (zero padding optional) and return it unchanged.
+
+    Raises:
+        ValueError: If the value is not a date.
+    """
+    try:
+        year, month, day = value.split('-')
+        date(int(year), int(month), int(day))
+    except (ValueError, AttributeError, TypeError):
+        raise ValueError(f"Not a YYYY-MM-DD date: {value!r}") from None
+    return value
+
+
+def _date_argument(value):
+    try:
+        return check_date(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def socket_path(db_name):
+    """
+    Return the Unix socket path of the daemon that serves a database.
+
+    Args:
+        db_name (str): The database file, e.g. 'main.db'.
+
+    Returns:
+        str: The socket path, e.g. 'main.sock'.
+    """
+    root, _ = os.path.splitext(db_name)
+    return f"{root}.sock"
+
+
+def send(command, args=None, path='main.sock', timeout=5.0):
+    """
+    Send one command to the daemon and return its result.
+
+    Args:
+        command (str): The command name, see daemon.COMMANDS.
+        args (dict, optional): The keyword arguments of the command.
+        path (str): The daemon's socket path.
+        timeout (float): Seconds to wait for the daemon.
+
+    Returns:
+        The JSON-decoded result of the command.
+
+    Raises:
+        OSError: If the daemon is not running.
+        CommandError: If the command failed in the daemon.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps({'command': command, 'args': args or {}}).encode() + b'\n')
+        with sock.makefile('rb') as stream:
+            line = stream.readline()
+    if not line:
+        raise ConnectionError("The daemon closed the connection without a response")
+    response = json.loads(line)
+    if not response['ok']:
+        raise CommandError(response['error'])
+    return response['result']
+
+
+def call(command, args=None, db_name='main.db', path=None):
+    """
+    Run a command in the daemon, or in-process if the daemon is down.
+
+    Args:
+        command (str): The command name, see daemon.COMMANDS.
+        args (dict, optional): The keyword arguments of the command.
+        db_name (str): The database used by the in-process fallback.
+        path (str, optional): The daemon's socket path. Defaults to socket_path(db_name).
+
+    Returns:
+        The JSON-decoded result of the command.
+
+    Raises:
+        CommandError: If the command failed.
+    """
+    try:
+        return send(command, args, path or socket_path(db_name))
+    except (FileNotFoundError, ConnectionRefusedError):    # No daemon is listening
+        import daemon
+        daemon.configure(db_name)
+        try:
+            result = daemon.run_command(command, args or {})
+        except Exception as e:
+            raise CommandError(f"{type(e).__name__}: {e}") from e   # Same error as the daemon reports
+        return json.loads(json.dumps(result))   # Same types as over the socket
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run a habit tracker command, through the daemon if it is running.")
+    parser.add_argument('--db', default='main.db', help="Database file (default: main.db)")
+    parser.add_argument('--socket', help="Daemon socket (default: derived from --db)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('ping', help="Check whether the daemon answers")
+    create = commands.add_parser('create', help="Create a habit")
+    create.add_argument('name')
+    create.add_argument('description')
+    create.add_argument('--period', choices=['Daily', 'Weekly'], default='Daily')
+    update = commands.add_parser('update', help="Rename a habit and replace its description")
+    update.add_argument('name')
+    update.add_argument('new_name')
+    update.add_argument('description')
+    delete = commands.add_parser('delete', help="Delete a habit")
+    delete.add_argument('name')
+    check_off = commands.add_parser('check-off', help="Mark a habit as completed and update its streaks")
+    check_off.add_argument('name')
+    check_off.add_argument('--period', choices=['Daily', 'Weekly'], default='Daily')
+    check_off.add_argument('--date', type=_date_argument, help="The completed date as YYYY-MM-DD (default: today)")
+    show = commands.add_parser('show', help="Show a habit")
+    show.add_argument('name')
+    listing = commands.add_parser('list', help="List habits")
+    listing.add_argument('--period', choices=['Daily', 'Weekly'])
+    streaks = commands.add_parser('streaks', help="Show the current and longest streak of a habit")
+    streaks.add_argument('name')
+    streaks.add_argument('--period', choices=['Daily', 'Weekly'], default='Daily')
+    commands.add_parser('longest', help="Show the longest streak on record")
+    return parser
+
+
+if __name__ == '__main__':
+    args = vars(build_parser().parse_args())
+    db_name, path, command = args.pop('db'), args.pop('socket'), args.pop('command').replace('-', '_')
+    for key in ('name', 'new_name'):
+        if args.get(key):
+            args[key] = args[key].strip().title()   # Same normalisation as the interactive menu
+    try:
+        result = call(command, {key: value for key, value in args.items() if value is not None}, db_name, path)
+    except CommandError as e:
+        sys.exit(f"Error: {e}")
+    print(json.dumps(result))
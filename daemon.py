@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+
+from client import check_date, socket_path
+from habit_tracker import Habit
+from sketches import PopulationStats
+from storage import MemoryBackend, SQLiteBackend
+
+"""
+Habit Tracker Daemon
+
+A long-lived process that serves habit commands over a Unix domain socket, so the thin
+client (client.py) does not pay for importing the app, opening the database and rebuilding
+caches on every call. The daemon keeps one database connection open for its lifetime, and
+its streak segments, population sketches and (with --in-memory) the habits themselves stay
+warm between requests.
+
+Protocol: one JSON object per line in each direction.
+    request:  {"command": "check_off", "args": {"name": "Reading", "period": "Daily"}}
+    response: {"ok": true, "result": [3, 5]} or {"ok": false, "error": "..."}
+
+Usage:
+    python daemon.py [--db main.db] [--socket main.sock] [--in-memory]
+"""
+
+_configured = None  # The (db_name, in_memory) the Habit class was set up for
+SKETCH_REBUILD_INTERVAL = 60.0  # Seconds between rebuilds of the population sketches after changes
+
+
+def configure(db_name, in_memory=False):
+    """
+    Point the Habit class at a database, as main.py does. Repeated calls with the same settings do nothing.
+
+    Args:
+        db_name (str): The database file.
+        in_memory (bool): Keep habits in memory and snapshot them to db_name.
+    """
+    global _configured
+    if _configured == (db_name, in_memory):
+        return
+    Habit._DB_NAME = db_name
+    if in_memory:
+        storage = MemoryBackend(db_name)
+    else:   # One connection for the daemon's lifetime instead of one per operation
+        storage = SQLiteBackend(db_name, Habit._BUSY_TIMEOUT, Habit._MAX_RETRIES, Habit._RETRY_BACKOFF, persistent=True)
+    previous = Habit.use_storage(storage)
+    if previous is not None:
+        previous.close()
+    # Quantile sketches are rebuilt in the background, never while a client waits
+    previous = Habit.use_stats(PopulationStats(db_name, storage=storage, rebuild_interval=SKETCH_REBUILD_INTERVAL))
+    if previous is not None:
+        previous.close()
+    _configured = (db_name, in_memory)
+
+
+def _create(name, description, period='Daily'):
+    habit = Habit(name=name, description=description)
+    if period == 'Weekly':
+        habit.save_weekly()
+    else:
+        habit.save_daily()
+    return True
+
+
+def _update(name, new_name, description):
+    if not Habit.load_one(name):
+        return False
+    Habit(name=name, description=description).update(new_name, description, name)
+    return True
+
+
+def _delete(name):
+    habit = Habit.load_one(name)
+    if not habit:
+        return False
+    habit.delete()
+    return True
+
+
+def _check_off(name, period='Daily', date=None):
+    if date is not None:
+        check_date(date)    # Before anything is stored, so a bad date cannot end up in the history
+    habit = Habit.load_by_name(name)
+    if not habit or habit.period != period:
+        return None
+    habit.mark_complete(date)
+    return Habit.update_streaks_incremental(name, date, number=7 if period == 'Weekly' else 1)
+
+
+def _show(name):
+    habit = Habit.load_one(name)
+    if not habit:
+        return None
+    return {'name': habit.name, 'description': habit.description,
+            'date_and_time_of_creation': str(habit.date_and_time_of_creation),
+            'period': habit.period, 'completed_dates': habit.completed_dates}
+
+
+def _list(period=None):
+    column_names, rows = Habit.load_list(period) if period else Habit.load_whole_list()
+    return {'columns': column_names, 'rows': rows}
+
+
+def _streaks(name, period='Daily'):
+    return Habit.load_streaks(name, period)
+
+
+COMMANDS = {
+    'ping': lambda: 'pong',
+    'create': _create,
+    'update': _update,
+    'delete': _delete,
+    'check_off': _check_off,
+    'show': _show,
+    'list': _list,
+    'streaks': _streaks,
+    'longest': Habit.load_longest_streak,
+}
+
+
+def run_command(command, args):
+    """
+    Run a command in this process.
+
+    Args:
+        command (str): The command name, a key of COMMANDS.
+        args (dict): The keyword arguments of the command.
+
+    Returns:
+        The command's result; tuples are returned as they are, JSON turns them into lists.
+
+    Raises:
+        KeyError: If the command is unknown.
+    """
+    if command not in COMMANDS:
+        raise KeyError(f"Unknown command: {command}")
+    return COMMANDS[command](**args)
+
+
+class HabitRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Answers each JSON request line of a connection with a JSON response line.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                response = {'ok': True, 'result': run_command(request['command'], request.get('args', {}))}
+            except Exception as e:
+                response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response, default=str).encode() + b'\n')
+            self.wfile.flush()
+
+
+class HabitDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A Unix socket server that handles each client connection in its own thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(path)
+                except ConnectionRefusedError:  # Left behind by a daemon that did not shut down cleanly
+                    os.remove(path)
+                else:
+                    raise OSError(f"A daemon is already listening on {path}")
+        super().__init__(path, HabitRequestHandler)
+        self.path = path
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def start_in_thread(path):
+    """
+    Start a daemon on a background thread, e.g. for tests or benchmarks.
+
+    Args:
+        path (str): The socket path to listen on.
+
+    Returns:
+        HabitDaemon: The running server; call shutdown() and server_close() to stop it.
+    """
+    server = HabitDaemon(path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve habit commands over a Unix domain socket.")
+    parser.add_argument('--db', default='main.db', help="Database file (default: main.db)")
+    parser.add_argument('--socket', help="Socket path (default: derived from --db)")
+    parser.add_argument('--in-memory', action='store_true', help="Keep habits in memory and snapshot them to --db")
+    args = parser.parse_args()
+
+    configure(args.db, args.in_memory)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))    # Remove the socket on kill as well
+    path = args.socket or socket_path(args.db)
+    with HabitDaemon(path) as server:
+        print(f"Serving {args.db} on {path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
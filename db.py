@@ -1,3 +1,4 @@
+import os
 import sqlite3
 
 
@@ -14,12 +15,13 @@ def get_db(name):
     db = sqlite3.connect(name)
     return db
 
-def create_table(db):
+def create_table(db, commit=True):
     """
     Create a table for storing habit tracking information if it doesn't already exist.
 
     Args:
         db (sqlite3.Connection): A connection object for the database.
+        commit (bool): Commit afterwards; pass False inside an explicit transaction.
 
     The table structure includes the following columns:
         - name (TEXT, PRIMARY KEY): The unique name of the habit.
@@ -29,6 +31,7 @@ def create_table(db):
         - completed_dates (TEXT): A string of dates when the habit was completed.
         - current_streak (INT): The current streak of the habit being maintained.
         - longest_streak (INT): The longest streak achieved for the habit.
+        - history_version (INTEGER): Changes whenever completed_dates does, see create_history_version().
         """
     cursor = db.cursor()
     cursor.execute("""
@@ -39,15 +42,298 @@ def create_table(db):
                     period TEXT,
                     completed_dates TEXT,
                     current_streak INT,
-                    longest_streak INT
+                    longest_streak INT,
+                    history_version INTEGER
                     )
                 """)
+    create_history_version(db, commit=False)
 
+    if commit:
+        db.commit()
 
-    db.commit()
+def create_history_version(db, commit=True):
+    """
+    Add the history_version column to the habit table if it is missing, and the triggers that keep it current.
+
+    Caches built from a habit's completed dates store its version and compare it with one
+    primary key lookup instead of reading the history. A new random version is assigned to
+    every new habit and on every change of completed_dates by any writer, unless the writer
+    sets a new version itself in the same statement (as StorageBackend.add_completion does).
+
+    Args:
+        db (sqlite3.Connection): A connection object for the database.
+        commit (bool): Commit afterwards; pass False inside an explicit transaction.
+    """
+    cursor = db.cursor()
+    if not any(row[1] == 'history_version' for row in cursor.execute("PRAGMA table_info(habit)")):
+        cursor.execute("ALTER TABLE habit ADD COLUMN history_version INTEGER")
+    cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS habit_history_version_insert AFTER INSERT ON habit
+                WHEN NEW.history_version IS NULL
+                BEGIN
+                    UPDATE habit SET history_version = random() WHERE rowid = NEW.rowid;
+                END
+                """)
+    cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS habit_history_version_update AFTER UPDATE OF completed_dates ON habit
+                WHEN OLD.completed_dates IS NOT NEW.completed_dates AND OLD.history_version IS NEW.history_version
+                BEGIN
+                    UPDATE habit SET history_version = random() WHERE rowid = NEW.rowid;
+                END
+                """)
+    if commit:
+        db.commit()
+
+def archive_path(name):
+    """
+    Return the file name of the archive database that belongs to a database.
+
+    Args:
+        name (str): The name of the main database file, e.g. 'main.db'.
+
+    Returns:
+        str: The archive file name, e.g. 'main_archive.db'.
+    """
+    root, ext = os.path.splitext(name)
+    return f"{root}_archive{ext or '.db'}"
+
+def create_archive_tables(db):
+    """
+    Create the tables for cold completion history if they don't already exist.
+
+    The archive database must already be attached to the connection as 'archive'.
+
+    Args:
+        db (sqlite3.Connection): A connection object for the main database.
+
+    The archive database holds one row per archived completion:
+        - name (TEXT): The name of the habit.
+        - completed_date (TEXT): The completed date as YYYY-MM-DD.
+
+    The main database keeps one row of aggregates per habit with archived history:
+        - name (TEXT, PRIMARY KEY): The name of the habit.
+        - archived_count (INT): The number of archived completions.
+        - first_date (TEXT): The earliest archived completion.
+        - last_date (TEXT): The latest archived completion.
+    """
+    cursor = db.cursor()
+    cursor.execute("""
+                CREATE TABLE IF NOT EXISTS archive.completion (
+                    name TEXT NOT NULL,
+                    completed_date TEXT NOT NULL,
+                    PRIMARY KEY (name, completed_date)
+                    ) WITHOUT ROWID
+                """)
+    cursor.execute("""
+                CREATE TABLE IF NOT EXISTS main.habit_archive (
+                    name TEXT PRIMARY KEY,
+                    archived_count INT NOT NULL,
+                    first_date TEXT,
+                    last_date TEXT
+                    )
+                """)
+
+
+def attach_archive(db, name):
+    """
+    Attach the archive database as 'archive' if it exists and holds archived completions.
+
+    Args:
+        db (sqlite3.Connection): A connection to the main database, outside of a transaction.
+        name (str): The name of the main database file, used to locate the archive.
+
+    Returns:
+        bool: True if the archive is attached, including when it already was.
+    """
+    if any(row[1] == 'archive' for row in db.execute("PRAGMA database_list")):
+        return True
+    if not os.path.exists(archive_path(name)):
+        return False
+    db.execute("ATTACH DATABASE ? AS archive", (archive_path(name),))
+    if db.execute("SELECT 1 FROM archive.sqlite_master WHERE type = 'table' AND name = 'completion'").fetchone():
+        return True
+    db.execute("DETACH DATABASE archive")
+    return False
 
 
+def full_history_sql(alias):
+    """
+    Return a SQL expression for the JSON list of a habit's archived and hot completed dates.
+
+    The archive must be attached as 'archive'. Archived dates (oldest first) come before
+    the hot ones, as Habit.load_one() returns them.
+
+    Args:
+        alias (str): The name or alias of the habit table in the query.
+    """
+    return f"""(SELECT json_group_array(completed_date) FROM (
+                    SELECT completed_date FROM archive.completion WHERE name = {alias}.name
+                    UNION ALL
+                    SELECT value FROM json_each({alias}.completed_dates) WHERE json_valid({alias}.completed_dates)))"""
+
+
+CHANGE_FEED_TRIGGERS = ('habit_change_save', 'habit_change_update', 'habit_change_delete',
+                        'habit_change_mark_complete', 'habit_change_update_streaks')
+
+
+def create_change_feed(db, commit=True):
+    """
+    Create the change feed tables if they don't already exist, and (re)create the triggers that fill them.
+
+    The triggers run inside the statement that changes the habit table, so every change is
+    recorded in the same transaction as save_*, update, delete, mark_complete and update_streaks.
+    Changes are only recorded while at least one consumer is registered (see changefeed.py),
+    so a database nobody reads the feed of does not grow a habit_change table. Updates that
+    write back unchanged values are not recorded, and neither are rewrites of completed_dates
+    while the feed is paused (see pause_change_feed). Existing triggers are dropped first, so
+    calling this again replaces them.
+
+    Args:
+        db (sqlite3.Connection): A connection object for the database.
+        commit (bool): Commit afterwards; pass False inside an explicit transaction.
+
+    The habit_change table includes the following columns:
+        - seq (INTEGER, PRIMARY KEY AUTOINCREMENT): A sequence number that only ever increases,
+          even after old changes have been truncated.
+        - name (TEXT): The name of the habit that changed.
+        - operation (TEXT): 'save', 'update', 'delete', 'mark_complete' or 'update_streaks'.
+        - changed_at (DATETIME): When the change was recorded (UTC).
+        - data (TEXT): A JSON object with the changed values, NULL for deletes. For mark_complete
+          it only holds the added dates, not the whole history.
+
+    The change_consumer table records how far each registered consumer has read:
+        - consumer (TEXT, PRIMARY KEY): The name of the consumer.
+        - cursor (INT): The last sequence number the consumer has acknowledged.
+
+    The change_feed_pause table holds a row while a maintenance transaction has paused the feed.
+    """
+    cursor = db.cursor()
+    cursor.execute("""
+                CREATE TABLE IF NOT EXISTS habit_change (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    operation TEXT NOT NULL,
+                    changed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    data TEXT
+                    )
+                """)
+    cursor.execute("""
+                CREATE TABLE IF NOT EXISTS change_consumer (
+                    consumer TEXT PRIMARY KEY,
+                    cursor INT NOT NULL DEFAULT 0
+                    )
+                """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS change_feed_pause (paused INT)")
+    for trigger in CHANGE_FEED_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("""
+                CREATE TRIGGER habit_change_save AFTER INSERT ON habit
+                WHEN EXISTS (SELECT 1 FROM change_consumer)
+                BEGIN
+                    INSERT INTO habit_change (name, operation, data) VALUES (NEW.name, 'save',
+                        json_object('description', NEW.description, 'date_and_time_of_creation', NEW.date_and_time_of_creation, 'period', NEW.period));
+                END
+                """)
+    cursor.execute("""
+                CREATE TRIGGER habit_change_update AFTER UPDATE OF name, description ON habit
+                WHEN (OLD.name IS NOT NEW.name OR OLD.description IS NOT NEW.description) AND EXISTS (SELECT 1 FROM change_consumer)
+                BEGIN
+                    INSERT INTO habit_change (name, operation, data) VALUES (NEW.name, 'update',
+                        json_object('previous_name', OLD.name, 'description', NEW.description));
+                END
+                """)
+    cursor.execute("""
+                CREATE TRIGGER habit_change_delete AFTER DELETE ON habit
+                WHEN EXISTS (SELECT 1 FROM change_consumer)
+                BEGIN
+                    INSERT INTO habit_change (name, operation) VALUES (OLD.name, 'delete');
+                END
+                """)
+    cursor.execute("""
+                CREATE TRIGGER habit_change_mark_complete AFTER UPDATE OF completed_dates ON habit
+                WHEN OLD.completed_dates IS NOT NEW.completed_dates AND NOT EXISTS (SELECT 1 FROM change_feed_pause)
+                     AND EXISTS (SELECT 1 FROM change_consumer)
+                BEGIN
+                    INSERT INTO habit_change (name, operation, data) VALUES (NEW.name, 'mark_complete',
+                        json_object('added_dates', (SELECT json_group_array(value) FROM json_each(NEW.completed_dates)
+                                                    WHERE value NOT IN (SELECT value FROM json_each(OLD.completed_dates)))));
+                END
+                """)
+    cursor.execute("""
+                CREATE TRIGGER habit_change_update_streaks AFTER UPDATE OF current_streak, longest_streak ON habit
+                WHEN (OLD.current_streak IS NOT NEW.current_streak OR OLD.longest_streak IS NOT NEW.longest_streak)
+                     AND EXISTS (SELECT 1 FROM change_consumer)
+                BEGIN
+                    INSERT INTO habit_change (name, operation, data) VALUES (NEW.name, 'update_streaks',
+                        json_object('current_streak', NEW.current_streak, 'longest_streak', NEW.longest_streak));
+                END
+                """)
+    if commit:
+        db.commit()
+
+
+def pause_change_feed(db):
+    """
+    Stop the change feed from recording completed_dates rewrites for the rest of the current transaction.
+
+    Meant for maintenance that rewrites completed_dates without new check-offs, such as
+    tiering or re-encoding dates. The pause is a row that other connections cannot see
+    before it is removed by resume_change_feed() in the same transaction; if the
+    transaction rolls back instead, the row goes with it.
+
+    Args:
+        db (sqlite3.Connection): A connection inside a write transaction.
+
+    Returns:
+        bool: True if the database has a change feed, which is now paused.
+    """
+    if not db.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'change_feed_pause'").fetchone():
+        return False
+    db.execute("INSERT INTO main.change_feed_pause (paused) VALUES (1)")
+    return True
+
+
+def resume_change_feed(db):
+    """
+    Undo pause_change_feed(); call it before the transaction commits.
+    """
+    db.execute("DELETE FROM main.change_feed_pause")
+
+
+def create_sketch_table(db, commit=True):
+    """
+    Create the tables for population statistics sketches if they don't already exist.
+
+    Args:
+        db (sqlite3.Connection): A connection object for the database.
+        commit (bool): Commit afterwards; pass False inside an explicit transaction.
+
+    The habit_sketch table includes the following columns:
+        - source (TEXT): '' for the sketches built from this database's habits, otherwise
+          the source ID of the database file they were merged from.
+        - metric (TEXT): The metric and period, e.g. 'current_streak:Daily'.
+        - kind (TEXT): 'kll' for a quantile sketch, 'hll' for a distinct counter.
+        - data (TEXT): The serialized sketch as JSON.
+
+    The sketch_source table holds the ID of this database's own sketches in other files:
+        - id (TEXT): A random hexadecimal ID, created on first use.
+    """
+    cursor = db.cursor()
+    cursor.execute("""
+                CREATE TABLE IF NOT EXISTS habit_sketch (
+                    source TEXT NOT NULL DEFAULT '',
+                    metric TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (source, metric)
+                    )
+                """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS sketch_source (id TEXT NOT NULL)")
+    if commit:
+        db.commit()
+
 
+if __name__ == '__main__':
+    from migrations import migrate
 
-db = get_db('main.db')
-create_table(db)
\ No newline at end of file
+    migrate('main.db')  # Creates the tables on a new database and upgrades an existing one
@@ -1,7 +1,23 @@
-import sqlite3
 from datetime import datetime, timedelta
 import json
+import threading
 
+from storage import SQLiteBackend
+from streaks import CompletionIndex, StreakSegments, as_ordinal
+
+
+
+def storage_for(owner):
+    """
+    Return the storage backend a Habit class or instance should use.
+
+    An explicitly configured backend (see Habit.use_storage) wins; otherwise the SQLite
+    backend is used with the owner's _DB_NAME and locking settings, so overriding
+    _DB_NAME on a class or an instance keeps working.
+    """
+    if owner._storage is not None:
+        return owner._storage
+    return SQLiteBackend(owner._DB_NAME, owner._BUSY_TIMEOUT, owner._MAX_RETRIES, owner._RETRY_BACKOFF)
 
 
 class Habit:
@@ -11,6 +27,11 @@ class Habit:
 
     Attributes:
         _DB_NAME (str): The name of the SQLite database file.
+        _storage (StorageBackend): A backend that replaces the SQLite file, or None.
+        _stats (PopulationStats): Told about streak updates and check-offs to refresh population sketches, or None.
+        _BUSY_TIMEOUT (float): Seconds to wait for a lock held by another connection.
+        _MAX_RETRIES (int): How often a locked write transaction is retried.
+        _RETRY_BACKOFF (float): The initial delay between retries, doubled each time.
         name (str): The name of the habit.
         description (str): A description of the habit.
         period (str): The frequency of the habit (e.g., "Daily" or "Weekly").
@@ -21,6 +42,14 @@ class Habit:
     """
 
     _DB_NAME ='main.db' # Database file name
+    _BUSY_TIMEOUT = 5.0  # Seconds SQLite waits on a locked database before raising
+    _MAX_RETRIES = 5  # Retries of a write transaction that still fails with "database is locked"
+    _RETRY_BACKOFF = 0.05  # Initial retry delay in seconds, doubled on every attempt
+    _storage = None  # StorageBackend used instead of the SQLite file, see use_storage()
+    _stats = None  # sketches.PopulationStats told about update_streaks and mark_complete, see use_stats()
+    _streak_cache = {}  # (storage key, habit name) -> (history stamp, StreakSegments), kept in sync by mark_complete
+    _count_cache = {}  # (storage key, habit name) -> (history stamp, CompletionIndex), kept in sync by mark_complete
+    _history_cache_lock = threading.Lock()
 
     def __init__(self,name = None, description=None, completed_dates=None, period = None, date_and_time_of_creation = None, longest_streak = None, current_streak = None):
         """
@@ -43,18 +72,42 @@ class Habit:
         self.longest_streak = longest_streak
         self.current_streak = current_streak
 
+    @classmethod
+    def use_storage(cls, storage):
+        """
+        Use a storage backend for every Habit instead of the SQLite file named by _DB_NAME.
+
+        Args:
+            storage (StorageBackend or None): The backend, e.g. a MemoryBackend. None switches
+                back to the SQLite database named by _DB_NAME.
+
+        Returns:
+            StorageBackend or None: The previously configured backend.
+        """
+        previous, cls._storage = cls._storage, storage
+        return previous
+
+    @classmethod
+    def use_stats(cls, stats):
+        """
+        Keep population sketches in step with every update_streaks() call and check-off.
+
+        Args:
+            stats (sketches.PopulationStats or None): The collector. None stops recording.
+
+        Returns:
+            PopulationStats or None: The previously configured collector.
+        """
+        previous, cls._stats = cls._stats, stats
+        return previous
+
     def save_weekly(self):
         """
         Save the habit as a weekly habit to the database.
         """
         period = "Weekly"
         cur_datetime = datetime.now().replace(second=0, microsecond=0)
-        with sqlite3.connect(self._DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                '''INSERT INTO habit (name, description, 'date_and_time_of_creation', period) VALUES (?,?,?,?) ''',
-                (self.name, self.description, cur_datetime, period))
-            conn.commit()
+        storage_for(self).insert_habit(self.name, self.description, cur_datetime, period)
 
     def save_daily(self):
         """
@@ -62,10 +115,7 @@ class Habit:
         """
         period = "Daily"
         cur_datetime = datetime.now().replace(second=0,microsecond=0)
-        with sqlite3.connect(self._DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''INSERT INTO habit (name, description, 'date_and_time_of_creation', period) VALUES (?,?,?,?) ''', (self.name, self.description, cur_datetime, period))
-            conn.commit()
+        storage_for(self).insert_habit(self.name, self.description, cur_datetime, period)
 
 
     def update(self, new_name, description, name):
@@ -77,45 +127,38 @@ class Habit:
             description (str): The updated description.
             name (str): The current name of the habit.
         """
-        with sqlite3.connect(self._DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''UPDATE habit SET name = ?, description = ? WHERE name = ?''', (new_name, description,name))
-            conn.commit()
+        storage = storage_for(self)
+        storage.update_habit(name, new_name, description)
+        self._forget_cached_history(storage.key, name)
 
     def delete(self):
         """
         Delete a habit from the database
         """
-        with sqlite3.connect(self._DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                DELETE FROM habit WHERE name = ?
-            """, (self.name,))
-            conn.commit()
+        storage = storage_for(self)
+        storage.delete_habit(self.name)
+        self._forget_cached_history(storage.key, self.name)
 
     @classmethod
-    def load_one(cls, name):
+    def load_one(cls, name, start=None, end=None):
         """
         Retrieve a habit by its name along with its tracking data.
 
         Args:
             name (str): The name of the habit to load.
+            start (str or date, optional): Only load completed dates on or after this date.
+            end (str or date, optional): Only load completed dates on or before this date.
 
         Returns:
-            Habit or None: The Habit instance if found, else None.
+            Habit or None: The Habit instance if found, else None. Without a date range the
+            completed dates cover the full history, including archived completions.
         """
-        with sqlite3.connect(cls._DB_NAME) as conn:
-            cursor = conn.cursor()
+        result = storage_for(cls).load_habit(name, start, end)
+        if not result:
+            return None
 
-            cursor.execute("""
-                SELECT name, description,date_and_time_of_creation,period, completed_dates  FROM habit WHERE name = ?      
-                """, (name,))
-            result = cursor.fetchone()
-            if not result:
-                return None
-
-            habit = cls(name=result[0], description=result[1], date_and_time_of_creation =result[2], period = result[3], completed_dates=result[4])
-            return habit
+        habit = cls(name=result[0], description=result[1], date_and_time_of_creation =result[2], period = result[3], completed_dates=result[4])
+        return habit
 
 
     @classmethod
@@ -129,14 +172,11 @@ class Habit:
         Returns:
             Habit or None: The Habit instance if found, else None.
         """
-        with sqlite3.connect(cls._DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT name, completed_dates, period FROM habit WHERE name = ?", (name,))
-            result = cursor.fetchone()
-            if not result: # If no result is found, return None
-                return None
-            habit = cls(name=result[0], completed_dates=result[1], period = result[2])
-            return habit
+        result = storage_for(cls).load_summary(name)
+        if not result: # If no result is found, return None
+            return None
+        habit = cls(name=result[0], completed_dates=result[1], period = result[2])
+        return habit
 
 
     @classmethod
@@ -150,12 +190,7 @@ class Habit:
         Returns:
             tuple: A tuple containing a list of column names and a list of rows with habit data.
         """
-        with sqlite3.connect(cls._DB_NAME) as conn:
-            cursor = conn.cursor()
-        cursor.execute("""SELECT name, description, Date_and_Time_of_Creation, period, completed_dates FROM habit WHERE period = ? """, (period,))
-        rows = cursor.fetchall() # Fetch all matching rows
-        column_names = [description[0] for description in cursor.description]
-        return column_names, rows
+        return storage_for(cls).list_habits(period)
 
     @classmethod
     def load_whole_list(cls):
@@ -165,32 +200,42 @@ class Habit:
         Returns:
             tuple: A tuple containing a list of column names and a list of rows with all habit data.
         """
-        with sqlite3.connect(cls._DB_NAME) as conn:
-            cursor = conn.cursor()
-        cursor.execute("""SELECT name, description, Date_and_Time_of_Creation, period, completed_dates FROM habit""")
-        rows = cursor.fetchall() # Fetch all rows
-        column_names = [description[0] for description in cursor.description]
-        return column_names, rows
+        return storage_for(cls).list_habits()
 
     @classmethod
-    def load_completed_dates(cls, name, period):
+    def load_many(cls, period=None, chunk_size=1000):
+        """
+        Load habits in bulk as lightweight HabitRecord objects.
+
+        Args:
+            period (str, optional): Only load habits with this period. Defaults to all habits.
+            chunk_size (int): The number of rows fetched from the database at a time.
+
+        Returns:
+            list: A list of HabitRecord instances. Completed dates are decoded lazily on first access.
+        """
+        habits = []
+        for rows in storage_for(cls).iter_rows(period, chunk_size):
+            habits.extend([HabitRecord(*row) for row in rows])
+        return habits
+
+    @classmethod
+    def load_completed_dates(cls, name, period, start=None, end=None):
         """
         Load the list of completed dates for a habit.
 
         Args:
             name (str): The name of the habit.
             period (str): The period of the habit.
+            start (str or date, optional): Only load dates on or after this date.
+            end (str or date, optional): Only load dates on or before this date.
 
         Returns:
-            list: A list of completed dates.
-        """
-        with sqlite3.connect(cls._DB_NAME) as conn:
-            cursor = conn.cursor()
-        cursor.execute("""SELECT completed_dates FROM habit WHERE name = ? AND period = ?""", (name,period))
-        result = cursor.fetchone()  # Fetch the result
-        if result:  # If a result is found, parse the JSON string into a list
-            completed_dates = json.loads(result[0]) # Extract the first element of the tuple
-        else:
+            list: A list of completed dates. Archived completions are included when
+            they fall inside the range (or no range is given).
+        """
+        completed_dates = storage_for(cls).completed_dates(name, period, start, end)
+        if completed_dates is None:
             completed_dates = []    # Return an empty list if no data is found
         return completed_dates
 
@@ -206,11 +251,7 @@ class Habit:
         Returns:
             tuple: A tuple containing the habit name, current streak, and longest streak.
         """
-        with sqlite3.connect(cls._DB_NAME) as conn:
-            cursor = conn.cursor()
-        cursor.execute("""SELECT name, current_streak, longest_streak FROM habit WHERE name = ? AND period = ?""", (name, period))
-        habit = cursor.fetchone() # Fetch the streak data
-        return habit
+        return storage_for(cls).streaks(name, period)
 
     @classmethod
     def load_longest_streak(cls):
@@ -220,11 +261,7 @@ class Habit:
         Returns:
             tuple: A tuple containing the longest streak and the name of the habit.
         """
-        with sqlite3.connect(cls._DB_NAME) as conn:
-            cursor = conn.cursor()
-        cursor.execute("""SELECT longest_streak,name FROM habit ORDER BY longest_streak DESC LIMIT 1""")
-        habit = cursor.fetchone()  # Fetch the habit with the longest streak
-        return habit
+        return storage_for(cls).longest_streak()
 
     @classmethod
     def update_streaks(cls, current_streak, longest_streak, name):
@@ -236,10 +273,10 @@ class Habit:
             longest_streak (int): The longest streak count.
             name (str): The name of the habit.
         """
-        with sqlite3.connect(cls._DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''UPDATE habit SET current_streak = ?, longest_streak = ? WHERE name = ?''', (current_streak,longest_streak,name))
-            conn.commit()
+        storage = storage_for(cls)
+        storage.set_streaks(name, current_streak, longest_streak)
+        if cls._stats is not None:
+            cls._stats.changed()
 
     def mark_complete(self, date=None):
         """
@@ -251,25 +288,171 @@ class Habit:
         if date is None:    # Default to today's date if no date is provided
             date = str(datetime.today().date())
 
-        if self.completed_dates is None:    # Initialize completed dates if not set
-                self.completed_dates = []
+        storage = storage_for(self)
+        result = storage.add_completion(self.name, date)   # Atomic, so concurrent check-offs are never lost
+        if result is None:    # Habit is not in the database; only track the date locally
+            if isinstance(self.completed_dates, str):
+                completed_dates = json.loads(self.completed_dates)
+            else:
+                completed_dates = list(self.completed_dates or [])
+            if date not in completed_dates:
+                completed_dates.append(date)
+        else:
+            completed_dates, (previous, stamp) = result
+            self._sync_cached_history(storage.key, date, previous, stamp)
+            if self._stats is not None:
+                info = storage.habit_info(self.name)
+                if info is not None:
+                    self._stats.record_check_off(self.name, info[0], date)
+        self.completed_dates = completed_dates
+
+    def _sync_cached_history(self, key, date, previous, stamp):
+        """
+        Add a newly completed date to the cached streak segments and completion index of this habit, if any.
+
+        A cache is dropped when it was not built at the history stamp the check-off started
+        from, e.g. after another process checked the habit off.
+        """
+        key = (key, self.name)
+        with self._history_cache_lock:
+            for cache in (self._streak_cache, self._count_cache):
+                entry = cache.get(key)
+                if entry is None:
+                    continue
+                if previous is not None and stamp is not None and entry[0] == previous:    # Nothing else was stored since it was built
+                    entry[1].add(date)
+                    cache[key] = (stamp, entry[1])
+                else:
+                    del cache[key]
+
+    @classmethod
+    def _forget_cached_history(cls, key, name):
+        with cls._history_cache_lock:
+            cls._streak_cache.pop((key, name), None)
+            cls._count_cache.pop((key, name), None)
+
+    @classmethod
+    def load_streak_segments(cls, name, number):
+        """
+        Return the run-length streak segments of a habit, building them from the database once.
+
+        The cached segments are checked against the history stamp of the stored habit on
+        every call and rebuilt if another process (or the daemon) changed its history.
+
+        Args:
+            name (str): The name of the habit.
+            number (int): The interval (in days) defining a streak.
+
+        Returns:
+            StreakSegments: The cached segments of the habit's completed dates.
+        """
+        storage = storage_for(cls)
+        key = (storage.key, name)
+        stamp = storage.history_stamp(name)
+        with cls._history_cache_lock:
+            entry = cls._streak_cache.get(key)
+        if entry is not None and entry[0] == stamp and entry[1].step == number:
+            return entry[1]
+        # Read after the stamp, so a concurrent write can only make the entry look stale, never fresh
+        segments = StreakSegments.from_dates(storage.completed_dates(name) or [], number)
+        if stamp is not None:
+            with cls._history_cache_lock:
+                cls._streak_cache[key] = (stamp, segments)
+        return segments
+
+    @classmethod
+    def load_completion_index(cls, name):
+        """
+        Return the prefix-sum completion index of a habit, building it from the database once.
+
+        Like the streak segments, the cached index is checked against the history stamp of
+        the stored habit on every call. Habits that do not exist are not cached.
+
+        Args:
+            name (str): The name of the habit.
+
+        Returns:
+            CompletionIndex: The cached index of the habit's completed dates, including archived ones.
+        """
+        storage = storage_for(cls)
+        key = (storage.key, name)
+        stamp = storage.history_stamp(name)
+        with cls._history_cache_lock:
+            entry = cls._count_cache.get(key)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        index = CompletionIndex.from_dates(storage.completed_dates(name) or [])
+        if stamp is not None:
+            with cls._history_cache_lock:
+                cls._count_cache[key] = (stamp, index)
+        return index
 
-        if isinstance(self.completed_dates, str):   # Parse the string into a list if needed
-                    self.completed_dates = json.loads(self.completed_dates)
+    @classmethod
+    def count_completions(cls, name, start=None, end=None):
+        """
+        Count the completions of a habit between two dates without scanning its history.
+
+        Args:
+            name (str): The name of the habit.
+            start (str or date, optional): The first day counted. Defaults to the first completion.
+            end (str or date, optional): The last day counted. Defaults to the last completion.
+
+        Returns:
+            int: The number of completed dates in the range, inclusive.
+        """
+        index = cls.load_completion_index(name)
+        with cls._history_cache_lock:
+            return index.count(start, end)
 
-                    # Avoid duplicate entries
-        if date not in self.completed_dates:
+    @classmethod
+    def completion_rate(cls, name, start=None, end=None, number=1):
+        """
+        Return the share of periods between two dates in which a habit was completed.
 
-                    self.completed_dates.append(date)
+        Args:
+            name (str): The name of the habit.
+            start (str or date, optional): The first day of the range. Defaults to the first completion.
+            end (str or date, optional): The last day of the range. Defaults to today.
+            number (int): The length of a period in days (1 for daily, 7 for weekly habits).
 
-                    # Update the database
-                    with sqlite3.connect(self._DB_NAME) as conn:
-                        cursor = conn.cursor()
-                        cursor.execute(
-                            "UPDATE habit SET completed_dates = ? WHERE name = ?",
-                            (json.dumps(self.completed_dates), self.name),   # Store as a JSON string
-                        )
-                        conn.commit()
+        Returns:
+            float: Completions per period in the range, between 0 and 1.
+        """
+        index = cls.load_completion_index(name)
+        with cls._history_cache_lock:
+            if index.origin is None:
+                return 0.0
+            first = index.origin if start is None else as_ordinal(start)
+            last = datetime.today().date().toordinal() if end is None else as_ordinal(end)
+            if last < first:
+                return 0.0
+            periods = (last - first) // number + 1
+            return min(1.0, index.count(first, last) / periods)
+
+    @classmethod
+    def update_streaks_incremental(cls, name, date=None, number=1):
+        """
+        Update the streaks of a habit after a completion on any date, without rescanning its history.
+
+        Unlike compute_streak(), the date may arrive out of order (e.g. a backfill from
+        another device); only the run-length segments around it are merged or split.
+
+        Args:
+            name (str): The name of the habit.
+            date (str, optional): The completed date. Defaults to today's date.
+            number (int): The interval (in days) defining a streak.
+
+        Returns:
+            tuple: The current streak and the longest streak.
+        """
+        if date is None:
+            date = str(datetime.today().date())
+        segments = cls.load_streak_segments(name, number)
+        with cls._history_cache_lock:
+            segments.add(date)
+            current_streak, longest_streak = segments.current_streak, segments.longest_streak
+        cls.update_streaks(current_streak, longest_streak, name)
+        return current_streak, longest_streak
 
     @classmethod
     def compute_streak(cls,completed_dates, name, number):
@@ -285,7 +468,6 @@ class Habit:
             The current and longest streaks are updated in the database.
         """
         sorted_dates = sorted(completed_dates)   # Sort dates chronologically
-        print(sorted_dates)
         longest_streak = 1
         current_streak = 1
         for i in range(1, len(sorted_dates)):
@@ -298,6 +480,55 @@ class Habit:
         Habit.update_streaks(current_streak, longest_streak, name)  # Update database
         return current_streak , longest_streak
 
+class HabitRecord:
+    """
+    A compact, read-only view of a habit row, used when loading many habits at once.
+
+    Unlike Habit, instances have no per-instance __dict__, and the completed dates are kept
+    as the raw JSON string from the database until they are first accessed.
+
+    Attributes:
+        name (str): The name of the habit.
+        description (str): A description of the habit.
+        date_and_time_of_creation (str): The creation timestamp of the habit.
+        period (str): The frequency of the habit (e.g., "Daily" or "Weekly").
+        completed_dates (list): The dates when the habit was completed, decoded on first access.
+        current_streak (int): The current streak of consecutive completions.
+        longest_streak (int): The longest streak of consecutive completions.
+    """
+
+    __slots__ = ('name', 'description', 'date_and_time_of_creation', 'period',
+                 '_raw_completed_dates', '_completed_dates', 'current_streak', 'longest_streak')
+
+    def __init__(self, name, description=None, date_and_time_of_creation=None, period=None,
+                 completed_dates=None, current_streak=None, longest_streak=None):
+        self.name = name
+        self.description = description
+        self.date_and_time_of_creation = date_and_time_of_creation
+        self.period = period
+        self._raw_completed_dates = completed_dates  # JSON string as stored in the database
+        self._completed_dates = None    # Decoded list, filled in on first access
+        self.current_streak = current_streak
+        self.longest_streak = longest_streak
+
+    @property
+    def completed_dates(self):
+        """
+        The completed dates as a list, decoded from JSON once and then cached.
+        """
+        if self._completed_dates is None:
+            raw = self._raw_completed_dates
+            if isinstance(raw, list):
+                self._completed_dates = raw
+            else:
+                self._completed_dates = json.loads(raw) if raw else []
+            self._raw_completed_dates = None    # Drop the encoded copy once decoded
+        return self._completed_dates
+
+    def __repr__(self):
+        return f"HabitRecord(name={self.name!r}, period={self.period!r})"
+
+
 def print_tables(column_names, rows):
     """
     Print a formatted table of habits.
@@ -0,0 +1,344 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from db import create_table
+from habit_tracker import Habit
+from storage import MemoryBackend, SQLiteBackend
+
+"""
+Habit Tracker Load Tester
+
+Builds a seeded synthetic population of habits and replays a mixed workload of habit
+creation, check-offs and analytics against the Habit API from several threads or
+processes. Reports throughput and p50/p95/p99 latency per operation type as JSON, so
+runs with different storage settings (--storage, --busy-timeout) can be compared.
+
+Usage:
+    python loadtest.py --workers 8 --ops 2000 --mix create=5,check_off=55,view=15,streaks=15,list=5,longest=5 --output result.json
+    python loadtest.py --storage memory --output memory.json
+"""
+
+DEFAULT_MIX = {
+    'create': 5,       # Create Habit
+    'check_off': 55,   # Check-off Daily/Weekly Habit
+    'view': 15,        # Analyze Habit -> View Habit
+    'streaks': 15,     # Analyze Habit -> current and longest streak
+    'list': 5,         # Analyze Habit -> list of Habits according to the period
+    'longest': 5,      # Analyze Habit -> longest recorded streak on record
+}
+PERIOD_INTERVALS = {'Daily': 1, 'Weekly': 7}
+STORAGE_KINDS = {
+    'sqlite': "a new SQLite connection per operation (the default)",
+    'persistent': "one SQLite connection per process, as daemon.py uses",
+    'memory': "MemoryBackend, snapshotted to the database when the run ends (threads only)",
+}
+TODAY = date(2024, 1, 1)  # Fixed "today" so seeded runs are reproducible
+
+
+def parse_mix(text):
+    """
+    Parse an operation mix such as "create=5,check_off=60" into a dict of weights.
+
+    Args:
+        text (str): Comma-separated operation=weight pairs.
+
+    Returns:
+        dict: The operation weights.
+    """
+    mix = {}
+    for item in text.split(','):
+        op, _, weight = item.partition('=')
+        op = op.strip()
+        if op not in DEFAULT_MIX:
+            raise ValueError(f"Unknown operation: {op}")
+        mix[op] = float(weight)
+    return mix
+
+
+def build_population(db_path, n_users, habits_per_user, history_days, seed):
+    """
+    Create a database with a reproducible synthetic population of habits.
+
+    Args:
+        db_path (str): The database file to create.
+        n_users (int): The number of simulated users.
+        habits_per_user (int): The number of habits per user.
+        history_days (int): How many days of history each habit may have.
+        seed (int): The random seed.
+
+    Returns:
+        list: The (name, period) pairs of the created habits.
+    """
+    rng = random.Random(seed)
+    habits = []
+    rows = []
+    for user in range(n_users):
+        for h in range(habits_per_user):
+            name = f"User {user} Habit {h}"
+            period = rng.choice(list(PERIOD_INTERVALS))
+            step = PERIOD_INTERVALS[period]
+            adherence = rng.uniform(0.3, 0.95)  # Probability of completing the habit in a given period
+            completed = [str(TODAY - timedelta(days=d)) for d in range(history_days - 1, -1, -step)
+                         if rng.random() < adherence]
+            created = TODAY - timedelta(days=history_days)
+            rows.append((name, f"Synthetic habit {h} of user {user}", f"{created} 00:00:00", period, json.dumps(completed)))
+            habits.append((name, period))
+    with sqlite3.connect(db_path) as conn:
+        create_table(conn)
+        conn.executemany(
+            '''INSERT INTO habit (name, description, date_and_time_of_creation, period, completed_dates) VALUES (?,?,?,?,?)''',
+            rows)
+        conn.commit()
+    return habits
+
+
+def check_off(name, period, day):
+    """
+    Check off a habit the same way main.check_off_daily() and main.check_off_weekly() do.
+    """
+    habit = Habit.load_by_name(name)
+    habit.mark_complete(str(day))
+    Habit.update_streaks_incremental(name, str(day), number=PERIOD_INTERVALS[period])
+
+
+def use_storage(kind, db_path):
+    """
+    Point the Habit class of this process at one of the STORAGE_KINDS.
+
+    Returns:
+        StorageBackend or None: The backend to close after the run, None for 'sqlite'.
+    """
+    if kind == 'memory':
+        backend = MemoryBackend(db_path, checkpoint_interval=None)
+    elif kind == 'persistent':
+        backend = SQLiteBackend(db_path, Habit._BUSY_TIMEOUT, Habit._MAX_RETRIES, Habit._RETRY_BACKOFF, persistent=True)
+    else:
+        backend = None
+    Habit.use_storage(backend)
+    return backend
+
+
+def _init_process(kind, db_path, busy_timeout):
+    Habit._BUSY_TIMEOUT = busy_timeout
+    use_storage(kind, db_path)
+
+
+def run_worker(db_path, habits, mix, n_ops, seed, worker_id):
+    """
+    Replay n_ops randomly chosen operations and record their latencies.
+
+    Args:
+        db_path (str): The database file.
+        habits (list): The (name, period) pairs of the existing habits.
+        mix (dict): The operation weights.
+        n_ops (int): The number of operations to run.
+        seed (int): The base random seed; each worker derives its own.
+        worker_id (int): The worker number, used for the seed and for unique habit names.
+
+    Returns:
+        dict: A list of latencies in seconds per operation type, plus a list of errors.
+    """
+    Habit._DB_NAME = db_path
+    rng = random.Random(seed * 1000003 + worker_id)
+    ops, weights = zip(*mix.items())
+    habits = list(habits)
+    latencies = {op: [] for op in ops}
+    errors = []
+    for i in range(n_ops):
+        op = rng.choices(ops, weights)[0]
+        name, period = rng.choice(habits)
+        started = time.perf_counter()
+        try:
+            if op == 'create':
+                new_habit = Habit(name=f"Worker {worker_id} Habit {i}", description="Created by the load tester")
+                period = rng.choice(list(PERIOD_INTERVALS))
+                new_habit.save_daily() if period == 'Daily' else new_habit.save_weekly()
+                habits.append((new_habit.name, period))
+            elif op == 'check_off':
+                check_off(name, period, TODAY + timedelta(days=rng.randrange(0, 30)))
+            elif op == 'view':
+                Habit.load_one(name)
+            elif op == 'streaks':
+                Habit.load_streaks(name, period)
+            elif op == 'list':
+                Habit.load_list(period)
+            elif op == 'longest':
+                Habit.load_longest_streak()
+        except sqlite3.Error as e:
+            errors.append(f"{op}: {e}")
+            continue
+        latencies[op].append(time.perf_counter() - started)
+    return {'latencies': latencies, 'errors': errors}
+
+
+def _run_worker_star(args):
+    return run_worker(*args)
+
+
+def percentile(sorted_values, p):
+    """
+    Return the p-th percentile (0-100) of a sorted list using the nearest-rank method.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))  # ceil(n * p / 100)
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(results, elapsed):
+    """
+    Combine worker results into throughput and latency percentiles per operation type.
+
+    Args:
+        results (list): The dicts returned by run_worker().
+        elapsed (float): The wall-clock duration of the run in seconds.
+
+    Returns:
+        dict: The summary, with latencies in milliseconds.
+    """
+    merged = {}
+    errors = []
+    for result in results:
+        errors.extend(result['errors'])
+        for op, values in result['latencies'].items():
+            merged.setdefault(op, []).extend(values)
+    operations = {}
+    for op, values in sorted(merged.items()):
+        values.sort()
+        operations[op] = {
+            'count': len(values),
+            'throughput': len(values) / elapsed,
+            'p50_ms': percentile(values, 50) * 1000 if values else None,
+            'p95_ms': percentile(values, 95) * 1000 if values else None,
+            'p99_ms': percentile(values, 99) * 1000 if values else None,
+            'max_ms': values[-1] * 1000 if values else None,
+        }
+    total = sum(len(values) for values in merged.values())
+    return {
+        'elapsed_s': elapsed,
+        'total_ops': total,
+        'throughput': total / elapsed,
+        'errors': len(errors),
+        'error_samples': errors[:10],
+        'operations': operations,
+    }
+
+
+def run_load_test(db_path=None, n_users=100, habits_per_user=5, history_days=365, workers=4,
+                  ops_per_worker=500, mix=None, use_processes=False, seed=42, storage='sqlite',
+                  busy_timeout=None):
+    """
+    Build a population and replay a mixed workload against it.
+
+    Args:
+        db_path (str, optional): The database file to use. Defaults to a temporary file.
+        n_users (int): The number of simulated users.
+        habits_per_user (int): The number of habits per user.
+        history_days (int): The days of history per habit.
+        workers (int): The number of concurrent threads or processes.
+        ops_per_worker (int): The number of operations each worker runs.
+        mix (dict, optional): The operation weights. Defaults to DEFAULT_MIX.
+        use_processes (bool): Run workers as processes instead of threads.
+        seed (int): The random seed for the population and the workload.
+        storage (str): One of STORAGE_KINDS.
+        busy_timeout (float, optional): Seconds SQLite waits on a lock. Defaults to Habit._BUSY_TIMEOUT.
+
+    Returns:
+        dict: The configuration and the summary produced by summarize().
+    """
+    if storage not in STORAGE_KINDS:
+        raise ValueError(f"Unknown storage: {storage}")
+    if storage == 'memory' and use_processes:
+        raise ValueError("The memory storage cannot be shared between processes")
+    mix = dict(mix or DEFAULT_MIX)
+    old_timeout = Habit._BUSY_TIMEOUT
+    busy_timeout = old_timeout if busy_timeout is None else busy_timeout
+    with tempfile.TemporaryDirectory() as tmp:
+        path = db_path or os.path.join(tmp, 'loadtest.db')
+        habits = build_population(path, n_users, habits_per_user, history_days, seed)
+        jobs = [(path, habits, mix, ops_per_worker, seed, worker_id) for worker_id in range(workers)]
+        old_db_name = Habit._DB_NAME
+        previous = Habit.use_storage(None)
+        backend = None
+        try:
+            if not use_processes:   # Worker processes set themselves up in _init_process()
+                Habit._BUSY_TIMEOUT = busy_timeout
+                backend = use_storage(storage, path)
+            started = time.perf_counter()
+            if use_processes:
+                with multiprocessing.Pool(workers, _init_process, (storage, path, busy_timeout)) as pool:
+                    results = pool.map(_run_worker_star, jobs)
+            else:
+                results = [None] * workers
+
+                def run(index):
+                    results[index] = run_worker(*jobs[index])
+
+                threads = [threading.Thread(target=run, args=(i,)) for i in range(workers)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            if backend is not None:
+                backend.close()     # Outside the timed run; MemoryBackend writes its snapshot here
+            Habit.use_storage(previous)
+            Habit._DB_NAME = old_db_name
+            Habit._BUSY_TIMEOUT = old_timeout
+
+    return {
+        'config': {
+            'users': n_users,
+            'habits_per_user': habits_per_user,
+            'history_days': history_days,
+            'workers': workers,
+            'ops_per_worker': ops_per_worker,
+            'mode': 'processes' if use_processes else 'threads',
+            'mix': mix,
+            'seed': seed,
+            'storage': storage,
+            'busy_timeout': busy_timeout,
+            'sqlite_version': sqlite3.sqlite_version,
+        },
+        'summary': summarize(results, elapsed),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a mixed workload against the habit tracker.")
+    parser.add_argument('--db', help="Database file to build the population in (default: a temporary file)")
+    parser.add_argument('--users', type=int, default=100, help="Number of simulated users")
+    parser.add_argument('--habits-per-user', type=int, default=5, help="Habits per user")
+    parser.add_argument('--history-days', type=int, default=365, help="Days of history per habit")
+    parser.add_argument('--workers', type=int, default=4, help="Number of concurrent workers")
+    parser.add_argument('--ops', type=int, default=500, help="Operations per worker")
+    parser.add_argument('--mix', type=parse_mix, help="Operation weights, e.g. create=5,check_off=60,view=35")
+    parser.add_argument('--processes', action='store_true', help="Use processes instead of threads")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed")
+    parser.add_argument('--storage', choices=STORAGE_KINDS, default='sqlite',
+                        help="Storage backend: " + "; ".join(f"{k}: {v}" for k, v in STORAGE_KINDS.items()))
+    parser.add_argument('--busy-timeout', type=float, help="Seconds SQLite waits on a lock (default: the app's setting)")
+    parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    if args.db and os.path.exists(args.db):
+        parser.error(f"{args.db} already exists; the load tester needs a fresh database")
+    if args.storage == 'memory' and args.processes:
+        parser.error("--storage memory cannot be combined with --processes")
+    report = run_load_test(args.db, args.users, args.habits_per_user, args.history_days, args.workers,
+                           args.ops, args.mix, args.processes, args.seed, args.storage, args.busy_timeout)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
@@ -1,5 +1,8 @@
+import argparse
 import questionary
 from habit_tracker import Habit, print_tables
+from storage import MemoryBackend
+from sketches import PopulationStats
 import json
 
 """
@@ -136,14 +139,13 @@ def check_off_daily():
     # Mark the habit as complete and compute the streak
     habit.mark_complete()
     period = 'Daily'
-    completed_dates = Habit.load_completed_dates(name, period)
 
-    # Check if completed dates exist for the habit
-    if not completed_dates:
+    # Check the habit's period; load_by_name() already read it, so the history (and archive) is not read again
+    if habit.period != period:
         print("Habit not found!  Make sure the habit name is spelt correctly and that you have the correct habit period.")
         main_menu()
 
-    habit.compute_streak(completed_dates, name, number=1)
+    Habit.update_streaks_incremental(name, number=1)
 
     print('Habit Checked off successfully')
     main_menu()
@@ -159,14 +161,13 @@ def check_off_weekly():
     # Mark the habit as complete and compute the streak
     habit.mark_complete()
     period = 'Weekly'
-    completed_dates = Habit.load_completed_dates(name, period)
 
-    # Check if completed dates exist for the habit
-    if not completed_dates:
+    # Check the habit's period; load_by_name() already read it, so the history (and archive) is not read again
+    if habit.period != period:
         print("Habit not found!  Make sure the habit name is spelt correctly and that you have the correct habit period.")
         main_menu()
 
-    habit.compute_streak(completed_dates, name, number=7)
+    Habit.update_streaks_incremental(name, number=7)
     print('Habit Checked off successfully')
     main_menu()
 
@@ -270,6 +271,14 @@ def analyze_habit():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Habit Tracker")
+    parser.add_argument('--in-memory', action='store_true',
+                        help="Keep habits in memory and snapshot them to main.db periodically and on exit")
+    args = parser.parse_args()
+    if args.in_memory:
+        Habit.use_storage(MemoryBackend('main.db'))
+    Habit.use_stats(PopulationStats('main.db'))  # Quantiles are refreshed by running sketches.py
+
     # Start the program with the main menu
     main_menu()
 
@@ -0,0 +1,235 @@
+import argparse
+import json
+import sqlite3
+import time
+from datetime import date
+
+from db import create_change_feed, create_history_version, create_sketch_table, create_table, pause_change_feed, resume_change_feed
+from storage import run_immediate
+
+"""
+Versioned Schema Migrations
+
+The schema version of a database is kept in PRAGMA user_version. Each migration moves it up
+by one: its schema step (DDL) runs in a single transaction together with the version bump,
+and its data backfill, if any, runs in small batches of rows, each in its own short
+IMMEDIATE transaction, so the app keeps reading and writing while a large main.db is
+upgraded. The last rowid of every committed batch is stored in schema_migration, so an
+interrupted migration resumes where it stopped. Every batch reports its progress and timing.
+
+Usage:
+    python migrations.py [--db main.db] [--target N] [--batch-size 500] [--status]
+"""
+
+
+class Migration:
+    """
+    One step of the schema history.
+
+    Attributes:
+        version (int): The user_version the database has after this migration.
+        description (str): What the migration does, for progress reports.
+        schema (callable): Called with a connection inside a transaction to change the schema, or None.
+        backfill (callable): Called as backfill(cursor, after_rowid, batch_size) inside a
+            transaction to rewrite one batch of rows; returns the last rowid it looked at and
+            the number of rows, or None when no rows are left. None if the migration has no
+            data to rewrite.
+        table (str): The table the backfill walks, used for progress reports.
+    """
+
+    def __init__(self, version, description, schema=None, backfill=None, table='habit'):
+        self.version = version
+        self.description = description
+        self.schema = schema
+        self.backfill = backfill
+        self.table = table
+
+    def __repr__(self):
+        return f"Migration({self.version}, {self.description!r})"
+
+
+def reencode_completed_dates(cursor, after_rowid, batch_size):
+    """
+    Rewrite one batch of completed_dates lists as zero-padded "YYYY-MM-DD" dates.
+
+    Dates that only differed by padding are merged. The change feed is paused for the
+    batch's transaction, so the re-encoding does not show up as check-offs in the feed
+    and its triggers stay in place between batches. Entries that are not dates are kept
+    as they are.
+    """
+    rows = cursor.execute("SELECT rowid, completed_dates FROM habit WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                          (after_rowid, batch_size)).fetchall()
+    if not rows:
+        return None
+    updates = []
+    for rowid, completed_dates in rows:
+        dates = json.loads(completed_dates) if completed_dates else []
+        encoded = []
+        for d in dates:
+            # Converted here rather than with the app's helpers, so the migration keeps doing what it did
+            try:
+                year, month, day = d.split('-')
+                encoded.append(date(int(year), int(month), int(day)).isoformat())
+            except (ValueError, AttributeError, TypeError):
+                encoded.append(d)
+        encoded = list(dict.fromkeys(encoded))  # Drop duplicates, keep order
+        if encoded != dates:
+            updates.append((json.dumps(encoded), rowid))
+    if updates:
+        conn = cursor.connection
+        paused = pause_change_feed(conn)
+        cursor.executemany("UPDATE habit SET completed_dates = ? WHERE rowid = ?", updates)
+        if paused:
+            resume_change_feed(conn)
+    return rows[-1][0], len(rows)
+
+
+def assign_history_versions(cursor, after_rowid, batch_size):
+    """
+    Give one batch of habits that have no history version yet a random one.
+    """
+    rows = cursor.execute("SELECT rowid FROM habit WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                          (after_rowid, batch_size)).fetchall()
+    if not rows:
+        return None
+    cursor.execute("UPDATE habit SET history_version = random() WHERE rowid > ? AND rowid <= ? AND history_version IS NULL",
+                   (after_rowid, rows[-1][0]))
+    return rows[-1][0], len(rows)
+
+
+MIGRATIONS = [
+    Migration(1, "create the habit table", schema=lambda conn: create_table(conn, commit=False)),
+    Migration(2, "create the change feed", schema=lambda conn: create_change_feed(conn, commit=False)),
+    Migration(3, "create the population sketch table", schema=lambda conn: create_sketch_table(conn, commit=False)),
+    Migration(4, "re-encode completed dates as YYYY-MM-DD", backfill=reencode_completed_dates),
+    Migration(5, "track a history version per habit", schema=lambda conn: create_history_version(conn, commit=False),
+              backfill=assign_history_versions),
+]
+
+
+def current_version(db_name):
+    """
+    Return the schema version (PRAGMA user_version) of a database.
+    """
+    with sqlite3.connect(db_name) as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _create_progress_table(cursor):
+    cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migration (
+                    version INTEGER PRIMARY KEY,
+                    last_rowid INT NOT NULL
+                    )
+                """)
+
+
+def _progress(db_name, migration):
+    def read(cursor):
+        _create_progress_table(cursor)
+        cursor.execute("SELECT last_rowid FROM schema_migration WHERE version = ?", (migration.version,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    return run_immediate(db_name, read)
+
+
+def _counts(db_name, table, after_rowid):
+    with sqlite3.connect(db_name) as conn:
+        total, done = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(rowid <= ?), 0) FROM {table}", (after_rowid,)).fetchone()
+    return total, done
+
+
+def print_progress(migration, batch, done, total, elapsed):
+    """
+    The default progress report: one line per committed batch.
+    """
+    share = f"{done / total:.0%}" if total else "100%"
+    print(f"v{migration.version} {migration.description}: batch {batch}, {done}/{total} rows ({share}) in {elapsed * 1000:.1f} ms")
+
+
+def apply_migration(db_name, migration, batch_size=500, report=print_progress, pause=0.0):
+    """
+    Apply one migration, resuming its backfill from the last committed batch.
+
+    Args:
+        db_name (str): The database file.
+        migration (Migration): The migration to apply; the database must be at migration.version - 1.
+        batch_size (int): Rows rewritten per transaction.
+        report (callable): Called as report(migration, batch, done, total, elapsed) after each batch, or None.
+        pause (float): Seconds to sleep between batches, to leave room for other writers.
+    """
+    def finish(cursor):
+        if migration.schema is not None:
+            migration.schema(cursor.connection)
+        _create_progress_table(cursor)
+        cursor.execute("DELETE FROM schema_migration WHERE version = ?", (migration.version,))
+        cursor.execute(f"PRAGMA user_version = {int(migration.version)}")
+
+    if migration.backfill is not None:
+        last_rowid = _progress(db_name, migration)
+        total, done = _counts(db_name, migration.table, last_rowid)
+        batch = 0
+        while True:
+            def step(cursor):
+                result = migration.backfill(cursor, last_rowid, batch_size)
+                if result is not None:     # Saved with the batch, so a restart resumes after it
+                    cursor.execute("INSERT OR REPLACE INTO schema_migration (version, last_rowid) VALUES (?, ?)",
+                                   (migration.version, result[0]))
+                return result
+            started = time.perf_counter()
+            result = run_immediate(db_name, step)
+            if result is None:
+                break
+            batch += 1
+            last_rowid, rows = result
+            done += rows
+            if report is not None:
+                report(migration, batch, done, total, time.perf_counter() - started)
+            if pause:
+                time.sleep(pause)
+    run_immediate(db_name, finish)
+
+
+def migrate(db_name, target=None, batch_size=500, report=print_progress, pause=0.0):
+    """
+    Bring a database up to a schema version, applying each pending migration in order.
+
+    Args:
+        db_name (str): The database file; a new file is created at the latest version.
+        target (int, optional): The version to stop at. Defaults to the latest version.
+        batch_size (int): Rows rewritten per backfill transaction.
+        report (callable): Progress callback, see apply_migration().
+        pause (float): Seconds to sleep between backfill batches.
+
+    Returns:
+        int: The schema version of the database afterwards.
+
+    Raises:
+        ValueError: If the database is newer than the target, which means this code is older than the database.
+    """
+    target = MIGRATIONS[-1].version if target is None else target
+    version = current_version(db_name)
+    if version > target:
+        raise ValueError(f"{db_name} is at schema version {version}, newer than {target}")
+    for migration in MIGRATIONS:
+        if version < migration.version <= target:
+            apply_migration(db_name, migration, batch_size, report, pause)
+            version = migration.version
+    return version
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Upgrade the schema of a habit database.")
+    parser.add_argument('--db', default='main.db', help="Database file (default: main.db)")
+    parser.add_argument('--target', type=int, help="Schema version to migrate to (default: latest)")
+    parser.add_argument('--batch-size', type=int, default=500, help="Rows rewritten per transaction")
+    parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between batches")
+    parser.add_argument('--status', action='store_true', help="Only print the current and latest version")
+    args = parser.parse_args()
+
+    if args.status:
+        print(f"{args.db}: schema version {current_version(args.db)} of {MIGRATIONS[-1].version}")
+    else:
+        started = time.perf_counter()
+        version = migrate(args.db, args.target, args.batch_size, pause=args.pause)
+        print(f"{args.db} is at schema version {version} ({time.perf_counter() - started:.2f}s)")
@@ -1,13 +1,16 @@
+import os
 import sqlite3
 
+from db import archive_path
+
 
 def drop_table(database_path):
     # Connect to the SQLite database
     conn = sqlite3.connect(database_path)
     cursor = conn.cursor()
 
-    # Get the names of all tables
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    # Get the names of all tables (SQLite's own tables, e.g. sqlite_sequence, cannot be dropped)
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
     tables = cursor.fetchall()
 
     # Drop each table
@@ -16,9 +19,14 @@ def drop_table(database_path):
         cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
         print(f"Table {table_name} dropped.")
 
+    # Reset the schema version so db.py creates the tables again
+    cursor.execute("PRAGMA user_version = 0")
+
     # Commit changes and close the connection
     conn.commit()
     conn.close()
     print("All tables dropped.")
 
-drop_table('main.db')
\ No newline at end of file
+drop_table('main.db')
+if os.path.exists(archive_path('main.db')):  # Archived history created by tiering.py
+    drop_table(archive_path('main.db'))
\ No newline at end of file
@@ -0,0 +1,527 @@
+import argparse
+import atexit
+import base64
+import hashlib
+import json
+import math
+import random
+import sqlite3
+import threading
+import uuid
+from datetime import date
+
+from db import create_sketch_table
+from storage import SQLiteBackend, run_immediate, to_iso_date
+from streaks import date_ordinal
+
+"""
+Population Statistics Sketches
+
+Small, mergeable summaries of every habit's streaks and completion rates, so dashboards can
+ask for the median, p90 or p99 by period without reading the whole habit table:
+
+    - KLLSketch: approximate quantiles with a bounded rank error, in O(k log n) space
+    - HyperLogLog: approximate distinct counts in a fixed 4 KiB of registers
+
+Two kinds of metrics are kept, each per period:
+    - Distinct counts (HyperLogLog) of the habits and days checked off only ever grow, so
+      Habit reports every check-off (see Habit.use_stats) and they are merged into the
+      stored counters in batches.
+    - Quantiles (KLL) describe one value per habit: its current and longest streak and its
+      completion rate. A sketch cannot forget a value, so after changes they are rebuilt
+      from one summary row per habit, which reads the stored streaks and completion counts
+      but no history. The rebuild runs in a background thread (daemon.py) or when this
+      script runs, never while a command waits for it.
+
+Because sketches merge, the sketches of several database files can be combined; each
+file's sketches are stored under its source ID, so merging the same file again replaces
+its earlier contribution instead of counting it twice.
+
+Usage:
+    python sketches.py [--db main.db] [--merge other.db ...]    # Rebuilds the quantiles first
+"""
+
+QUANTILES = (0.5, 0.9, 0.99)
+PERIOD_INTERVALS = {'Daily': 1, 'Weekly': 7}
+
+
+class KLLSketch:
+    """
+    A KLL quantile sketch.
+
+    Items are kept in a stack of compactors; an item in compactor h stands for 2**h
+    original items. When the sketch is full, the lowest full compactor is sorted and
+    every other item (with a random offset) is promoted to the next level. The rank error
+    is about 1.7 / k of n with high probability, regardless of n.
+
+    Attributes:
+        k (int): The accuracy parameter; larger is more accurate and bigger.
+        n (int): The number of items added.
+        compactors (list): One list of items per level.
+    """
+
+    C = 2 / 3  # Capacity ratio between a level and the one above it
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.compactors = [[]]
+        self._rng = random.Random(seed)
+        self._sorted = None     # Cached (item, weight) pairs for queries
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil(self.C ** depth * self.k)) + 1
+
+    def _max_size(self):
+        return sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def _size(self):
+        return sum(len(items) for items in self.compactors)
+
+    def update(self, item):
+        """
+        Add an item to the sketch.
+        """
+        self.compactors[0].append(item)
+        self.n += 1
+        self._sorted = None
+        if self._size() >= self._max_size():
+            self._compress()
+
+    def _compress(self):
+        for level in range(len(self.compactors)):
+            items = self.compactors[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append([])
+                items.sort()
+                keep = [items.pop()] if len(items) % 2 else []  # An odd item out stays on this level
+                self.compactors[level + 1].extend(items[self._rng.random() < 0.5::2])
+                self.compactors[level] = keep
+                if self._size() < self._max_size():
+                    break
+
+    def merge(self, other):
+        """
+        Merge another KLL sketch into this one.
+        """
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.n += other.n
+        self._sorted = None
+        while self._size() >= self._max_size():
+            self._compress()
+
+    def _weighted(self):
+        if self._sorted is None:
+            pairs = sorted((item, 1 << level) for level, items in enumerate(self.compactors) for item in items)
+            self._sorted = pairs
+        return self._sorted
+
+    def quantile(self, q):
+        """
+        Return an item whose rank is approximately q * n, or None if the sketch is empty.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+        """
+        pairs = self._weighted()
+        if not pairs:
+            return None
+        total = sum(weight for _, weight in pairs)
+        target = q * total
+        cumulative = 0
+        for item, weight in pairs:
+            cumulative += weight
+            if cumulative >= target:
+                return item
+        return pairs[-1][0]
+
+    def to_dict(self):
+        return {'k': self.k, 'n': self.n, 'compactors': self.compactors}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['k'])
+        sketch.n = data['n']
+        sketch.compactors = [list(items) for items in data['compactors']]
+        return sketch
+
+
+class HyperLogLog:
+    """
+    A HyperLogLog distinct counter with 2**p registers.
+
+    With the default p=12 the standard error is about 1.6%, and two counters merge by
+    taking the maximum of each register.
+
+    Attributes:
+        p (int): The number of index bits.
+        registers (bytearray): The register values.
+    """
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = bytearray(1 << p)
+
+    def add(self, value):
+        """
+        Add a value; values are compared by their string form.
+        """
+        h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1   # Position of the first set bit
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """
+        Merge another counter with the same p into this one.
+        """
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLog counters of different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self):
+        """
+        Return the estimated number of distinct values added.
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:   # Small range correction
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self):
+        return {'p': self.p, 'registers': base64.b64encode(bytes(self.registers)).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data):
+        counter = cls(data['p'])
+        counter.registers = bytearray(base64.b64decode(data['registers']))
+        return counter
+
+
+SKETCH_KINDS = {'kll': KLLSketch, 'hll': HyperLogLog}
+LOCAL_SOURCE = ''  # The source of the sketches a database built from its own habit table
+
+
+def build_snapshot_sketches(summaries, k=200, today=None):
+    """
+    Build the quantile sketches of a snapshot of habits, one value per habit and metric.
+
+    Args:
+        summaries (iterable): Rows as returned by StorageBackend.habit_summaries().
+        k (int): The accuracy parameter of the KLL sketches.
+        today (date, optional): The day completion rates are measured up to. Defaults to today.
+
+    Returns:
+        dict: Metric name -> KLLSketch.
+    """
+    today = (today or date.today()).toordinal()
+    sketches = {}
+
+    def sketch(metric):
+        if metric not in sketches:
+            sketches[metric] = KLLSketch(k)
+        return sketches[metric]
+
+    for _, period, created, completions, current_streak, longest_streak in summaries:
+        if current_streak is not None:
+            sketch(f"current_streak:{period}").update(current_streak)
+        if longest_streak is not None:
+            sketch(f"longest_streak:{period}").update(longest_streak)
+        try:
+            first = date_ordinal(str(created)[:10]) if created else None
+        except ValueError:
+            first = None
+        if first is not None and first <= today:
+            periods = (today - first) // PERIOD_INTERVALS.get(period, 1) + 1
+            sketch(f"completion_rate:{period}").update(min(1.0, completions / periods))
+    return sketches
+
+
+def source_id(db_name):
+    """
+    Return the ID that identifies a database's own sketches when they are merged elsewhere.
+
+    The ID is created on first use and stored in the database, so it survives copying the file.
+    """
+    def read(cursor):
+        create_sketch_table(cursor.connection, commit=False)
+        cursor.execute("SELECT id FROM sketch_source")
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        new_id = uuid.uuid4().hex
+        cursor.execute("INSERT INTO sketch_source (id) VALUES (?)", (new_id,))
+        return new_id
+
+    return run_immediate(db_name, read)
+
+
+def _read_rows(db_name):
+    with sqlite3.connect(db_name) as conn:
+        try:
+            return conn.execute("SELECT source, metric, kind, data FROM habit_sketch").fetchall()
+        except sqlite3.OperationalError:    # No statistics recorded yet
+            return []
+
+
+def load_sketches(db_name):
+    """
+    Load the persisted sketches of a database, merged over its own and every merged-in source.
+
+    Args:
+        db_name (str): The database file.
+
+    Returns:
+        dict: Metric name -> KLLSketch or HyperLogLog.
+    """
+    sketches = {}
+    for _, metric, kind, data in _read_rows(db_name):
+        sketch = SKETCH_KINDS[kind].from_dict(json.loads(data))
+        if metric in sketches:
+            sketches[metric].merge(sketch)
+        else:
+            sketches[metric] = sketch
+    return sketches
+
+
+def store_sketches(db_name, sketches, source=LOCAL_SOURCE, kinds=None, timeout=5.0):
+    """
+    Replace the persisted sketches of one source in a single transaction.
+
+    Args:
+        db_name (str): The database file.
+        sketches (dict): Metric name -> KLLSketch or HyperLogLog.
+        source (str): The source ID the sketches belong to; LOCAL_SOURCE for the database's own.
+        kinds (tuple, optional): Only replace sketches of these kinds ('kll', 'hll'). Defaults to all.
+        timeout (float): The busy timeout in seconds.
+    """
+    names = {cls: kind for kind, cls in SKETCH_KINDS.items()}
+    kinds = tuple(kinds or SKETCH_KINDS)
+
+    def store(cursor):
+        create_sketch_table(cursor.connection, commit=False)
+        cursor.execute(f"DELETE FROM habit_sketch WHERE source = ? AND kind IN ({','.join('?' * len(kinds))})",
+                       (source,) + kinds)
+        cursor.executemany("INSERT INTO habit_sketch (source, metric, kind, data) VALUES (?,?,?,?)",
+                           [(source, metric, names[type(sketch)], json.dumps(sketch.to_dict()))
+                            for metric, sketch in sketches.items() if names[type(sketch)] in kinds])
+
+    run_immediate(db_name, store, timeout)
+
+
+def merge_sketches(db_name, sketches, timeout=5.0):
+    """
+    Merge sketches into the database's own persisted ones in a single transaction.
+
+    Args:
+        db_name (str): The database file.
+        sketches (dict): Metric name -> KLLSketch or HyperLogLog.
+        timeout (float): The busy timeout in seconds.
+    """
+    names = {cls: kind for kind, cls in SKETCH_KINDS.items()}
+
+    def merge(cursor):
+        create_sketch_table(cursor.connection, commit=False)
+        for metric, sketch in sketches.items():
+            cursor.execute("SELECT kind, data FROM habit_sketch WHERE source = ? AND metric = ?", (LOCAL_SOURCE, metric))
+            row = cursor.fetchone()
+            if row is not None:
+                stored = SKETCH_KINDS[row[0]].from_dict(json.loads(row[1]))
+                stored.merge(sketch)
+                sketch = stored
+            cursor.execute("INSERT OR REPLACE INTO habit_sketch (source, metric, kind, data) VALUES (?,?,?,?)",
+                           (LOCAL_SOURCE, metric, names[type(sketch)], json.dumps(sketch.to_dict())))
+
+    run_immediate(db_name, merge, timeout)
+
+
+def summarize(sketches):
+    """
+    Answer the dashboard questions from a set of sketches.
+
+    Args:
+        sketches (dict): Metric name -> sketch, as returned by load_sketches().
+
+    Returns:
+        dict: Per metric, the quantiles (for KLL sketches) or the distinct count (for
+        HyperLogLog counters), with an "All" entry merged over every period.
+    """
+    merged = {}
+    for metric, sketch in sketches.items():
+        name, _, period = metric.partition(':')
+        for key in (metric, f"{name}:All"):
+            if key not in merged:
+                merged[key] = type(sketch).from_dict(sketch.to_dict())
+            elif key != metric:
+                merged[key].merge(sketch)
+    summary = {}
+    for metric, sketch in sorted(merged.items()):
+        if isinstance(sketch, KLLSketch):
+            summary[metric] = {'n': sketch.n, **{f"p{int(q * 100)}": sketch.quantile(q) for q in QUANTILES}}
+        else:
+            summary[metric] = {'distinct': sketch.count()}
+    return summary
+
+
+class PopulationStats:
+    """
+    Keeps the sketches of a database in step with its habits.
+
+    Habit reports every check-off with record_check_off() and every streak update with
+    changed(). Check-offs go into in-memory counters that are merged into the stored ones
+    after flush_every check-offs and at exit. Changes only mark the quantile sketches as
+    stale; rebuild() refreshes them, every rebuild_interval seconds in a background thread
+    if one is given. Recorded metrics, each per period ("Daily" or "Weekly"):
+        - current_streak / longest_streak: KLL sketches of each habit's stored streaks
+        - completion_rate: KLL sketch of each habit's completions per period since creation
+        - habits_checked_off: HyperLogLog count of distinct habits with a check-off
+        - active_days: HyperLogLog count of distinct dates with a check-off
+
+    Attributes:
+        db_name (str): The database whose habit_sketch table receives the sketches.
+        flush_every (int): Check-offs counted in memory before they are stored.
+        storage (StorageBackend): Where the habit summaries for rebuild() are read from.
+        rebuild_interval (float): Seconds between background rebuilds, or None for none.
+    """
+
+    def __init__(self, db_name, flush_every=1000, k=200, storage=None, rebuild_interval=None):
+        self.db_name = db_name
+        self.flush_every = flush_every
+        self.k = k
+        self.storage = storage if storage is not None else SQLiteBackend(db_name)
+        self.rebuild_interval = rebuild_interval
+        self._counters = {}     # Metric -> HyperLogLog of the check-offs not stored yet
+        self._pending = 0       # Check-offs in _counters
+        self._stale = False     # Streaks or completions changed since the last rebuild
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if rebuild_interval:
+            self._thread = threading.Thread(target=self._rebuild_loop, name='sketch-rebuild', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def record_check_off(self, name, period, completed_date):
+        """
+        Count a check-off in the distinct counters and mark the quantile sketches as stale.
+        """
+        try:
+            completed_date = to_iso_date(completed_date)
+        except (ValueError, AttributeError, TypeError):
+            completed_date = None
+        with self._lock:
+            for metric, value in ((f"habits_checked_off:{period}", name), (f"active_days:{period}", completed_date)):
+                if value is not None:
+                    self._counters.setdefault(metric, HyperLogLog()).add(value)
+            self._pending += 1
+            self._stale = True
+            full = self._pending >= self.flush_every
+        if full:
+            self.flush()
+
+    def changed(self, count=1):
+        """
+        Report that habits changed without a check-off, e.g. new streaks.
+        """
+        if count:
+            with self._lock:
+                self._stale = True
+
+    def flush(self):
+        """
+        Merge the counters of the recorded check-offs into the stored ones.
+        """
+        with self._lock:
+            counters, self._counters, self._pending = self._counters, {}, 0
+        if counters:
+            merge_sketches(self.db_name, counters)
+
+    def rebuild(self, force=False):
+        """
+        Rebuild the quantile sketches from one summary row per habit if anything changed.
+
+        Args:
+            force (bool): Rebuild even if no change was reported, e.g. after the habit
+                table was changed outside of Habit.
+        """
+        with self._lock:
+            stale, self._stale = self._stale, False
+        if not (stale or force):
+            return
+        try:
+            store_sketches(self.db_name, build_snapshot_sketches(self.storage.habit_summaries(), self.k), kinds=('kll',))
+        except BaseException:
+            with self._lock:
+                self._stale = self._stale or stale   # Retried by the next rebuild
+            raise
+
+    def _rebuild_loop(self):
+        while not self._stop.wait(self.rebuild_interval):
+            try:
+                self.rebuild()
+            except sqlite3.Error:
+                pass    # Still stale, so the next interval retries
+
+    def close(self):
+        """
+        Stop the background rebuilds and store the pending counters.
+        """
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+        atexit.unregister(self.close)
+
+    def summary(self):
+        """
+        Flush and return the summary of every metric, see summarize().
+        """
+        self.flush()
+        return summarize(load_sketches(self.db_name))
+
+
+def merge_databases(target_db, source_dbs):
+    """
+    Merge the persisted sketches of other database files into a database.
+
+    Each database's own sketches are stored under its source ID, and the sketches it
+    merged in earlier keep theirs, so merging a file again (or a file that merged the
+    same third one) replaces the earlier copy instead of counting it twice.
+
+    Args:
+        target_db (str): The database that receives the merged sketches.
+        source_dbs (list): The database files to read sketches from.
+    """
+    target = source_id(target_db)
+    for source_db in source_dbs:
+        own = source_id(source_db)
+        by_source = {}
+        for source, metric, kind, data in _read_rows(source_db):
+            source = own if source == LOCAL_SOURCE else source
+            if source != target:    # The target's own sketches are already up to date
+                by_source.setdefault(source, {})[metric] = SKETCH_KINDS[kind].from_dict(json.loads(data))
+        for source, sketches in by_source.items():
+            store_sketches(target_db, sketches, source)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Print approximate population statistics of all habits.")
+    parser.add_argument('--db', default='main.db', help="Database file (default: main.db)")
+    parser.add_argument('--merge', nargs='+', default=[], metavar='DB', help="Merge the sketches of these databases into --db first")
+    args = parser.parse_args()
+
+    stats = PopulationStats(args.db)
+    stats.rebuild(force=True)
+    stats.close()
+    merge_databases(args.db, args.merge)
+    print(json.dumps(summarize(load_sketches(args.db)), indent=2))
@@ -0,0 +1,126 @@
+import argparse
+import sqlite3
+import time
+
+from db import attach_archive
+from habit_tracker import Habit
+
+"""
+SQL Streak Engine
+
+Computes current and longest streaks inside SQLite, without moving completed dates into
+Python. Completed dates are unpacked with json_each (plus the archived ones, if the archive
+database exists), and streaks are found as "islands" with window functions:
+
+    1. LAG() and LEAD() compare each completion with its neighbours; a distance equal to the
+       habit's period (1 day for daily, 7 for weekly habits) joins them into one island.
+    2. Only the first and last completion of every island are kept, so the second window
+       pass, which pairs them up, runs over a small fraction of the rows.
+    3. An island's length follows from its first and last day; the longest streak is the
+       longest island and the current streak the last one.
+
+The results are written back with a single UPDATE ... FROM for one habit or for all of them.
+Like StreakSegments, dates are compared as days, so "2023-1-5" and "2023-01-05" are the same
+completion and duplicates count once.
+
+Usage:
+    python sqlstreaks.py [--db main.db] [--name NAME]
+"""
+
+# Turns a "YYYY-M-D" value (zero padding optional) into a day number; padded dates skip the reformatting
+_DAY = """CAST(julianday(CASE WHEN length({v}) = 10 THEN {v} ELSE printf('%04d-%02d-%02d',
+                substr({v}, 1, 4),
+                substr({v}, 6, instr(substr({v}, 6), '-') - 1),
+                substr({v}, 6 + instr(substr({v}, 6), '-'))) END) AS INTEGER)"""
+
+_STEP = "CASE habit.period WHEN 'Weekly' THEN 7 ELSE 1 END"
+SORT_CACHE_KIB = 64 * 1024  # Page cache of the engine's connection; the default 2 MiB makes large sorts spill
+
+
+def _streaks_query(name_filter, with_archive):
+    archived = f"""
+            UNION
+            SELECT habit.name, {_STEP}, CAST(julianday(archive.completion.completed_date) AS INTEGER)
+            FROM habit JOIN archive.completion ON archive.completion.name = habit.name
+            WHERE 1 {name_filter}""" if with_archive else ""
+    return f"""
+        WITH completion (name, step, day) AS (
+            SELECT DISTINCT habit.name, {_STEP}, {_DAY.format(v='json_each.value')}
+            FROM habit, json_each(habit.completed_dates)
+            WHERE json_valid(habit.completed_dates) {name_filter}
+            {archived}
+        ),
+        neighbour AS (
+            SELECT name, step, day,
+                   day - LAG(day) OVER w = step AS joins_previous,
+                   LEAD(day) OVER w - day = step AS joins_next
+            FROM completion
+            WHERE day IS NOT NULL
+            WINDOW w AS (PARTITION BY name ORDER BY day)
+        ),
+        boundary AS (
+            SELECT name, step, day, joins_previous, joins_next
+            FROM neighbour
+            WHERE joins_previous IS NOT 1 OR joins_next IS NOT 1
+        ),
+        island AS (
+            SELECT name, joins_next,
+                   (day - CASE WHEN joins_previous THEN LAG(day) OVER w ELSE day END) / step + 1 AS length,
+                   LEAD(day) OVER w IS NULL AS is_last
+            FROM boundary
+            WINDOW w AS (PARTITION BY name ORDER BY day)
+        ),
+        streak AS (
+            SELECT name,
+                   MAX(CASE WHEN is_last THEN length END) AS current_streak,
+                   MAX(length) AS longest_streak
+            FROM island
+            WHERE joins_next IS NOT 1
+            GROUP BY name
+        )"""
+
+
+def compute_streaks_sql(db_name, name=None, write=True):
+    """
+    Compute the current and longest streaks of one habit or all habits inside SQLite.
+
+    Args:
+        db_name (str): The database file.
+        name (str, optional): Only compute the streaks of this habit. Defaults to all habits.
+        write (bool): Store the streaks in the habit table with a single UPDATE ... FROM.
+
+    Returns:
+        dict: Habit name -> (current_streak, longest_streak), for habits with at least one completion.
+    """
+    conn = sqlite3.connect(db_name, timeout=Habit._BUSY_TIMEOUT)
+    try:
+        conn.execute(f"PRAGMA cache_size = -{SORT_CACHE_KIB}")  # Lets the window sorts stay in memory
+        with_archive = attach_archive(conn, db_name)
+        name_filter = "AND habit.name = :name" if name is not None else ""
+        query = _streaks_query(name_filter, with_archive)
+        if write:
+            rows = conn.execute(query + """
+                UPDATE habit SET current_streak = streak.current_streak, longest_streak = streak.longest_streak
+                FROM streak WHERE habit.name = streak.name
+                RETURNING habit.name, habit.current_streak, habit.longest_streak""",
+                                {'name': name}).fetchall()
+            conn.commit()
+        else:
+            rows = conn.execute(query + """
+                SELECT name, current_streak, longest_streak FROM streak""", {'name': name}).fetchall()
+    finally:
+        conn.close()
+    if write and rows and Habit._stats is not None:
+        Habit._stats.changed(len(rows))
+    return {habit_name: (current_streak, longest_streak) for habit_name, current_streak, longest_streak in rows}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Recompute habit streaks inside SQLite.")
+    parser.add_argument('--db', default='main.db', help="Database file (default: main.db)")
+    parser.add_argument('--name', help="Only recompute this habit (default: all habits)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    streaks = compute_streaks_sql(args.db, args.name)
+    print(f"Updated the streaks of {len(streaks)} habits in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,774 @@
+import abc
+import atexit
+import contextlib
+import json
+import sqlite3
+import random
+import re
+import threading
+import time
+from datetime import date
+
+from db import archive_path, attach_archive, create_table, full_history_sql
+from streaks import date_ordinal
+
+
+def is_locked_error(error):
+    """
+    Return True if a SQLite error was caused by another connection holding a lock.
+    """
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def run_immediate(db_name, work, timeout=5.0, retries=5, backoff=0.05, conn=None):
+    """
+    Run a read-modify-write operation inside a BEGIN IMMEDIATE transaction.
+
+    The write lock is taken before anything is read, so two connections can never
+    both read the same row and then overwrite each other's changes. If the lock
+    cannot be taken within the busy timeout, the transaction is retried with
+    exponential backoff and jitter.
+
+    Args:
+        db_name (str): The SQLite database file.
+        work (callable): Called with a cursor inside the transaction; its return value is returned.
+        timeout (float): The busy timeout in seconds for each attempt.
+        retries (int): The number of retries after the first attempt.
+        backoff (float): The initial delay between retries in seconds.
+        conn (sqlite3.Connection, optional): An open connection to use instead of a new one,
+            e.g. one with the archive attached. It must not be in a transaction and is left open.
+
+    Returns:
+        The value returned by work.
+
+    Raises:
+        sqlite3.OperationalError: If the database is still locked after the last retry.
+    """
+    own = conn is None
+    if own:
+        conn = sqlite3.connect(db_name, timeout=timeout, isolation_level=None)  # Transactions are managed explicitly
+    try:
+        for attempt in range(retries + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                result = work(conn.cursor())
+                conn.execute("COMMIT")
+                return result
+            except sqlite3.OperationalError as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                if not is_locked_error(e) or attempt == retries:
+                    raise
+                time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+    finally:
+        if own:
+            conn.close()
+
+
+def to_iso_date(value):
+    """
+    Normalise a date or a "YYYY-M-D" string to a zero-padded "YYYY-MM-DD" string.
+    """
+    if value is None or isinstance(value, date):
+        return value.isoformat() if value is not None else None
+    return date.fromordinal(date_ordinal(value)).isoformat()
+
+
+_ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}$')
+
+
+def normalize_dates(values):
+    """
+    Normalise completed dates with to_iso_date() and drop duplicates, keeping their order.
+
+    Entries that are not dates are passed through as they are, as the date re-encoding
+    migration keeps them, instead of failing the whole read.
+    """
+    seen = set()
+    normalized = []
+    for value in values:
+        try:
+            value = to_iso_date(value)
+        except (ValueError, AttributeError, TypeError):
+            pass
+        key = value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            normalized.append(value)
+    return normalized
+
+
+def in_date_range(value, start=None, end=None):
+    """
+    Return True if a normalised completed date lies between two "YYYY-MM-DD" dates; entries that are not dates never do.
+    """
+    if not isinstance(value, str) or not _ISO_DATE.match(value):
+        return False
+    return (start is None or value >= start) and (end is None or value <= end)
+
+
+def load_archive_summary(cursor, name):
+    """
+    Return the (archived_count, first_date, last_date) aggregates of a habit, or None.
+
+    Databases that were never tiered have no habit_archive table, which is treated
+    the same as a habit without archived history.
+    """
+    try:
+        cursor.execute("SELECT archived_count, first_date, last_date FROM habit_archive WHERE name = ?", (name,))
+    except sqlite3.OperationalError:
+        return None
+    return cursor.fetchone()
+
+
+def attach_archive_for(conn, db_name, name):
+    """
+    Attach the archive database as 'archive' if the habit has archived history.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the main database, outside of a transaction.
+        db_name (str): The main database file, used to locate the archive.
+        name (str): The name of the habit.
+
+    Returns:
+        bool: True if the habit has archived history and the archive is attached.
+    """
+    if not load_archive_summary(conn.cursor(), name):
+        return False
+    if not any(row[1] == 'archive' for row in conn.execute("PRAGMA database_list")):
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path(db_name),))
+    return True
+
+
+def read_completed_dates(conn, db_name, name, raw, start=None, end=None):
+    """
+    Decode a habit's hot completed dates and add any archived dates in the requested range.
+
+    The archive database is only attached when the range overlaps the habit's archived
+    history, so queries about recent dates only touch the habit table.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the main database.
+        db_name (str): The main database file, used to locate the archive.
+        name (str): The name of the habit.
+        raw (str): The completed_dates JSON from the habit table.
+        start (str or date, optional): The first date to include. Defaults to the beginning of the history.
+        end (str or date, optional): The last date to include. Defaults to the end of the history.
+
+    Returns:
+        list: The completed dates as "YYYY-MM-DD" strings without duplicates, archived dates
+        (oldest first) before hot ones. Entries that are not dates are kept as stored, and
+        left out of ranged reads.
+    """
+    start, end = to_iso_date(start), to_iso_date(end)
+    completed_dates = normalize_dates(json.loads(raw)) if raw else []
+    if start is not None or end is not None:
+        completed_dates = [d for d in completed_dates if in_date_range(d, start, end)]
+
+    summary = load_archive_summary(conn.cursor(), name)
+    if not summary or (start is not None and start > summary[2]) or (end is not None and end < summary[1]):
+        return completed_dates  # Hot tier only
+
+    attached = any(row[1] == 'archive' for row in conn.execute("PRAGMA database_list"))
+    if not attached:
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path(db_name),))
+    try:
+        archived = [row[0] for row in conn.execute(
+            """SELECT completed_date FROM archive.completion WHERE name = ? AND completed_date BETWEEN ? AND ? ORDER BY completed_date""",
+            (name, start or '0000-00-00', end or '9999-99-99'))]
+    finally:
+        if not attached:
+            conn.execute("DETACH DATABASE archive")
+    archived_set = set(archived)
+    return archived + [d for d in completed_dates if not isinstance(d, str) or d not in archived_set]
+
+
+def is_archived(db_name, name, date):
+    """
+    Return True if a completed date of a habit is in the archive database.
+
+    Reads the archive through its own connection, so it can be called inside a write
+    transaction on the main database, where ATTACH is not allowed.
+    """
+    conn = sqlite3.connect(archive_path(db_name))
+    try:
+        return conn.execute("SELECT 1 FROM completion WHERE name = ? AND completed_date = ?",
+                            (name, to_iso_date(date))).fetchone() is not None
+    finally:
+        conn.close()
+
+
+class StorageBackend(abc.ABC):
+    """
+    The storage operations the Habit class needs, independent of where habits are kept.
+
+    Rows returned by a backend use the column order of the habit table. Completed dates
+    are returned as lists unless noted otherwise.
+
+    Attributes:
+        key (str): Identifies the stored data, e.g. for caches shared between backends.
+    """
+
+    key = None
+
+    @abc.abstractmethod
+    def insert_habit(self, name, description, date_and_time_of_creation, period):
+        """Store a new habit. Raises sqlite3.IntegrityError if the name is taken."""
+
+    @abc.abstractmethod
+    def update_habit(self, name, new_name, description):
+        """Rename a habit and replace its description."""
+
+    @abc.abstractmethod
+    def delete_habit(self, name):
+        """Delete a habit and its history."""
+
+    @abc.abstractmethod
+    def load_habit(self, name, start=None, end=None):
+        """Return (name, description, date_and_time_of_creation, period, completed_dates) or None."""
+
+    @abc.abstractmethod
+    def load_summary(self, name):
+        """Return (name, completed_dates, period) or None; completed_dates may still be encoded."""
+
+    @abc.abstractmethod
+    def list_habits(self, period=None):
+        """Return the column names and rows shown by load_list() and load_whole_list()."""
+
+    @abc.abstractmethod
+    def iter_rows(self, period=None, chunk_size=1000):
+        """Yield lists of full rows with completed_dates still encoded, for load_many()."""
+
+    @abc.abstractmethod
+    def completed_dates(self, name, period=None, start=None, end=None):
+        """Return the completed dates of a habit, or None if there is no such habit."""
+
+    @abc.abstractmethod
+    def habit_info(self, name):
+        """Return (period, date_and_time_of_creation) of a habit, or None."""
+
+    @abc.abstractmethod
+    def history_stamp(self, name):
+        """
+        Return a version of a habit's stored history, or None if there is no such habit or no version.
+
+        The stamp changes whenever the history does, and is read without reading the history;
+        caches built from the history compare it to notice changes made by other processes.
+        """
+
+    @abc.abstractmethod
+    def add_completion(self, name, date):
+        """
+        Atomically add a completed date.
+
+        Returns:
+            tuple or None: The stored completed dates and the history stamps before and after
+            the change, or None if there is no such habit. A cache built at the first stamp
+            only needs the date added to match the second one.
+        """
+
+    @abc.abstractmethod
+    def streaks(self, name, period):
+        """Return (name, current_streak, longest_streak) or None."""
+
+    @abc.abstractmethod
+    def set_streaks(self, name, current_streak, longest_streak):
+        """Store the current and longest streaks of a habit."""
+
+    @abc.abstractmethod
+    def longest_streak(self):
+        """Return (longest_streak, name) for the habit with the longest streak, or None."""
+
+    @abc.abstractmethod
+    def habit_summaries(self):
+        """
+        Return (name, period, date_and_time_of_creation, completions, current_streak, longest_streak)
+        for every habit, where completions includes archived ones and no history is read.
+        """
+
+    def close(self):
+        """Release any resources held by the backend."""
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Stores habits in a SQLite database file.
+
+    By default every operation opens and closes its own connection. A persistent backend
+    keeps one connection open instead and serializes the operations on it, which saves
+    opening the database (and re-attaching the archive) per call in a long-running
+    process such as daemon.py. Other processes still see every change as soon as the
+    operation returns.
+
+    Attributes:
+        db_name (str): The SQLite database file.
+        timeout (float): Seconds to wait for a lock held by another connection.
+        retries (int): How often a locked write transaction is retried.
+        backoff (float): The initial delay between retries, doubled each time.
+    """
+
+    def __init__(self, db_name, timeout=5.0, retries=5, backoff=0.05, persistent=False):
+        self.db_name = db_name
+        self.key = db_name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._conn = None
+        self._lock = threading.RLock()
+        if persistent:
+            # Shared by the daemon's request threads; _lock keeps them from interleaving
+            self._conn = sqlite3.connect(db_name, timeout=timeout, check_same_thread=False)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """
+        Yield a connection for one operation; changes are committed when it ends without an error.
+        """
+        if self._conn is not None:
+            with self._lock, self._conn:
+                yield self._conn
+            return
+        conn = sqlite3.connect(self.db_name, timeout=self.timeout)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def insert_habit(self, name, description, date_and_time_of_creation, period):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''INSERT INTO habit (name, description, 'date_and_time_of_creation', period) VALUES (?,?,?,?) ''',
+                           (name, description, date_and_time_of_creation, period))
+            conn.commit()
+
+    def update_habit(self, name, new_name, description):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            archived = attach_archive_for(conn, self.db_name, name)   # Must happen before the transaction starts
+            cursor.execute('''UPDATE habit SET name = ?, description = ? WHERE name = ?''', (new_name, description,name))
+            if archived:    # Keep the archived history with the renamed habit
+                cursor.execute("UPDATE habit_archive SET name = ? WHERE name = ?", (new_name, name))
+                cursor.execute("UPDATE archive.completion SET name = ? WHERE name = ?", (new_name, name))
+            conn.commit()
+
+    def delete_habit(self, name):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            archived = attach_archive_for(conn, self.db_name, name)
+            cursor.execute("""
+                DELETE FROM habit WHERE name = ?
+            """, (name,))
+            if archived:
+                cursor.execute("DELETE FROM habit_archive WHERE name = ?", (name,))
+                cursor.execute("DELETE FROM archive.completion WHERE name = ?", (name,))
+            conn.commit()
+
+    def load_habit(self, name, start=None, end=None):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT name, description,date_and_time_of_creation,period, completed_dates  FROM habit WHERE name = ?
+                """, (name,))
+            result = cursor.fetchone()
+            if not result:
+                return None
+            completed_dates = read_completed_dates(conn, self.db_name, name, result[4], start, end)
+        return result[:4] + (completed_dates,)
+
+    def load_summary(self, name):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name, completed_dates, period FROM habit WHERE name = ?", (name,))
+            return cursor.fetchone()
+
+    def list_habits(self, period=None):
+        with self._connect() as conn:
+            # Archived dates are merged into the JSON list by SQLite
+            completed_dates = full_history_sql('habit') if attach_archive(conn, self.db_name) else 'completed_dates'
+            query = f"""SELECT name, description, Date_and_Time_of_Creation, period, {completed_dates} AS completed_dates FROM habit"""
+            params = ()
+            if period is not None:
+                query += " WHERE period = ?"
+                params = (period,)
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall() # Fetch all matching rows
+        column_names = [description[0] for description in cursor.description]
+        return column_names, rows
+
+    def iter_rows(self, period=None, chunk_size=1000):
+        with self._connect() as conn:
+            completed_dates = full_history_sql('habit') if attach_archive(conn, self.db_name) else 'completed_dates'
+            query = f"""SELECT name, description, date_and_time_of_creation, period, {completed_dates}, current_streak, longest_streak FROM habit"""
+            params = ()
+            if period is not None:
+                query += " WHERE period = ?"
+                params = (period,)
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+
+    def completed_dates(self, name, period=None, start=None, end=None):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            if period is None:
+                cursor.execute("""SELECT completed_dates FROM habit WHERE name = ?""", (name,))
+            else:
+                cursor.execute("""SELECT completed_dates FROM habit WHERE name = ? AND period = ?""", (name,period))
+            result = cursor.fetchone()
+            if not result:
+                return None
+            return read_completed_dates(conn, self.db_name, name, result[0], start, end)
+
+    def habit_info(self, name):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT period, date_and_time_of_creation FROM habit WHERE name = ?", (name,))
+            return cursor.fetchone()
+
+    def history_stamp(self, name):
+        with self._connect() as conn:
+            try:
+                # One primary key lookup; the triggers from db.create_history_version() keep the version current
+                result = conn.execute("SELECT history_version FROM habit WHERE name = ?", (name,)).fetchone()
+            except sqlite3.OperationalError:    # Not migrated yet, so there is nothing cheap to compare with
+                return None
+        return result[0] if result else None
+
+    def add_completion(self, name, date):
+        def append_date(cursor):
+            # Read and write inside one IMMEDIATE transaction so concurrent check-offs cannot overwrite each other
+            try:
+                cursor.execute("SELECT completed_dates, history_version FROM habit WHERE name = ?", (name,))
+                versioned = True
+            except sqlite3.OperationalError:    # Not migrated yet: no history_version column
+                cursor.execute("SELECT completed_dates, NULL FROM habit WHERE name = ?", (name,))
+                versioned = False
+            result = cursor.fetchone()
+            if not result:
+                return None
+            completed_dates = json.loads(result[0]) if result[0] else []
+            version = result[1]
+            summary = load_archive_summary(cursor, name)
+            archived = summary is not None and summary[1] <= to_iso_date(date) <= summary[2] and is_archived(self.db_name, name, date)
+            if date not in completed_dates and not archived:    # Avoid duplicate entries, also of archived dates
+                completed_dates.append(date)
+                if versioned:
+                    version = random.getrandbits(63)
+                    cursor.execute(
+                        "UPDATE habit SET completed_dates = ?, history_version = ? WHERE name = ?",
+                        (json.dumps(completed_dates), version, name),   # Store as a JSON string
+                    )
+                else:
+                    cursor.execute(
+                        "UPDATE habit SET completed_dates = ? WHERE name = ?",
+                        (json.dumps(completed_dates), name),   # Store as a JSON string
+                    )
+            return completed_dates, (result[1], version)
+
+        with self._lock:
+            return run_immediate(self.db_name, append_date, self.timeout, self.retries, self.backoff, self._conn)
+
+    def streaks(self, name, period):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""SELECT name, current_streak, longest_streak FROM habit WHERE name = ? AND period = ?""", (name, period))
+            return cursor.fetchone()
+
+    def set_streaks(self, name, current_streak, longest_streak):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''UPDATE habit SET current_streak = ?, longest_streak = ? WHERE name = ?''', (current_streak,longest_streak,name))
+            conn.commit()
+
+    def longest_streak(self):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""SELECT longest_streak,name FROM habit ORDER BY longest_streak DESC LIMIT 1""")
+            return cursor.fetchone()
+
+    def habit_summaries(self):
+        with self._connect() as conn:
+            # Counted by SQLite from the stored lists and the archive aggregates, without attaching the archive
+            archived = "0"
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'habit_archive'").fetchone():
+                archived = "COALESCE((SELECT archived_count FROM habit_archive WHERE habit_archive.name = habit.name), 0)"
+            return conn.execute(f"""
+                SELECT name, period, date_and_time_of_creation,
+                       CASE WHEN json_valid(completed_dates) THEN json_array_length(completed_dates) ELSE 0 END + {archived},
+                       current_streak, longest_streak
+                FROM habit""").fetchall()
+
+
+class MemoryBackend(StorageBackend):
+    """
+    Keeps every habit in a dict in memory and snapshots it to a SQLite file.
+
+    Lookups are plain dict accesses. Changes are tracked per habit and written to the
+    snapshot database on an interval, on checkpoint() and on close(), which also runs
+    when the interpreter exits. On start-up the habits are restored from the snapshot.
+
+    The snapshot is the habit table of a normal database, so the SQLite tools (view.py,
+    tiering.py, the change feed) keep working on it. History that tiering.py moved to the
+    archive database is restored as well and read like SQLiteBackend reads it, but kept
+    apart from the hot dates, so checkpoints never copy it back into the habit table.
+
+    Attributes:
+        snapshot_path (str): The SQLite file to restore from and checkpoint to, or None.
+        checkpoint_interval (float): Seconds between automatic checkpoints, or None.
+    """
+
+    COLUMNS = ('name', 'description', 'Date_and_Time_of_Creation', 'period', 'completed_dates')
+
+    def __init__(self, snapshot_path='main.db', checkpoint_interval=30.0):
+        self.snapshot_path = snapshot_path
+        self.checkpoint_interval = checkpoint_interval
+        self.key = f"memory:{id(self)}"
+        self._habits = {}   # name -> [name, description, created, period, completed_dates, current, longest]
+        self._archived = {}     # name -> archived dates, oldest first (a dict used as an ordered set)
+        self._dirty = set()     # Names changed since the last checkpoint
+        self._changes = []      # ('rename', old, new) and ('delete', name) since the last checkpoint, in order
+        self._lock = threading.RLock()
+        self._checkpoint_lock = threading.Lock()    # One checkpoint at a time, so an older one cannot overwrite a newer one
+        self._stop = threading.Event()
+        self._thread = None
+        if snapshot_path is not None:
+            self.restore()
+            if checkpoint_interval:
+                self._thread = threading.Thread(target=self._checkpoint_loop, name='habit-checkpoint', daemon=True)
+                self._thread.start()
+            atexit.register(self.close)
+
+    def restore(self):
+        """
+        Load every habit and its archived history from the snapshot database, replacing what is in memory.
+        """
+        archived = {}
+        with sqlite3.connect(self.snapshot_path) as conn:
+            create_table(conn)
+            rows = conn.execute("""SELECT name, description, date_and_time_of_creation, period, completed_dates, current_streak, longest_streak FROM habit""").fetchall()
+            if attach_archive(conn, self.snapshot_path):
+                for name, completed_date in conn.execute("SELECT name, completed_date FROM archive.completion ORDER BY name, completed_date"):
+                    archived.setdefault(name, {})[completed_date] = None
+        with self._lock:
+            self._habits = {row[0]: [row[0], row[1], row[2], row[3], json.loads(row[4]) if row[4] else [], row[5], row[6]]
+                            for row in rows}
+            self._archived = archived
+            self._dirty.clear()
+            self._changes.clear()
+
+    def checkpoint(self):
+        """
+        Write the habits changed since the last checkpoint to the snapshot database.
+
+        Renames and deletes are replayed in order before the changed habits are written,
+        so a renamed habit keeps its row and its archived history.
+
+        Returns:
+            int: The number of habits written, renamed or deleted.
+        """
+        if self.snapshot_path is None:
+            return 0
+        with self._checkpoint_lock:
+            with self._lock:
+                dirty, changes = self._dirty, self._changes
+                self._dirty, self._changes = set(), []
+                rows = [(row[0], row[1], row[2], row[3], json.dumps(row[4]), row[5], row[6])
+                        for row in (self._habits.get(name) for name in dirty) if row is not None]
+
+            def write(cursor):
+                for change in changes:
+                    if change[0] == 'rename':
+                        _, name, new_name = change
+                        cursor.execute("UPDATE habit SET name = ? WHERE name = ?", (new_name, name))
+                        if archived:    # Keep the archived history with the renamed habit
+                            cursor.execute("UPDATE habit_archive SET name = ? WHERE name = ?", (new_name, name))
+                            cursor.execute("UPDATE archive.completion SET name = ? WHERE name = ?", (new_name, name))
+                    else:
+                        _, name = change
+                        cursor.execute("DELETE FROM habit WHERE name = ?", (name,))
+                        if archived:
+                            cursor.execute("DELETE FROM habit_archive WHERE name = ?", (name,))
+                            cursor.execute("DELETE FROM archive.completion WHERE name = ?", (name,))
+                cursor.executemany(
+                    """INSERT INTO habit (name, description, date_and_time_of_creation, period, completed_dates, current_streak, longest_streak)
+                       VALUES (?,?,?,?,?,?,?)
+                       ON CONFLICT(name) DO UPDATE SET description = excluded.description, period = excluded.period,
+                           completed_dates = excluded.completed_dates, current_streak = excluded.current_streak,
+                           longest_streak = excluded.longest_streak""",
+                    rows)
+
+            conn = sqlite3.connect(self.snapshot_path, isolation_level=None)
+            try:
+                archived = bool(changes) and attach_archive(conn, self.snapshot_path)  # Must happen before the transaction starts
+                run_immediate(self.snapshot_path, write, conn=conn)
+            except BaseException:
+                with self._lock:    # Try again at the next checkpoint
+                    self._dirty |= dirty
+                    self._changes[:0] = changes
+                raise
+            finally:
+                conn.close()
+        return len(rows) + len(changes)
+
+    def _checkpoint_loop(self):
+        while not self._stop.wait(self.checkpoint_interval):
+            try:
+                self.checkpoint()
+            except sqlite3.Error:
+                pass    # Changes stay dirty and are retried on the next interval
+
+    def close(self):
+        """
+        Stop the checkpoint thread and write a final checkpoint.
+        """
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.checkpoint()
+        atexit.unregister(self.close)
+
+    def _touch(self, name):
+        self._dirty.add(name)
+
+    def _history(self, name, row, start=None, end=None):
+        """
+        Return the archived and hot dates of a habit as "YYYY-MM-DD" strings, like read_completed_dates().
+        """
+        archived = self._archived.get(name, {})
+        completed_dates = list(archived) + [d for d in normalize_dates(row[4]) if not isinstance(d, str) or d not in archived]
+        if start is None and end is None:
+            return completed_dates
+        start, end = to_iso_date(start), to_iso_date(end)
+        return [d for d in completed_dates if in_date_range(d, start, end)]
+
+    def insert_habit(self, name, description, date_and_time_of_creation, period):
+        with self._lock:
+            if name in self._habits:
+                raise sqlite3.IntegrityError("UNIQUE constraint failed: habit.name")
+            self._habits[name] = [name, description, str(date_and_time_of_creation), period, [], None, None]
+            self._touch(name)
+
+    def update_habit(self, name, new_name, description):
+        with self._lock:
+            row = self._habits.get(name)
+            if row is None:
+                return
+            if new_name != name:
+                if new_name in self._habits:
+                    raise sqlite3.IntegrityError("UNIQUE constraint failed: habit.name")
+                del self._habits[name]
+                self._habits[new_name] = row
+                if name in self._archived:
+                    self._archived[new_name] = self._archived.pop(name)
+                self._dirty.discard(name)
+                self._changes.append(('rename', name, new_name))
+            row[0], row[1] = new_name, description
+            self._touch(new_name)
+
+    def delete_habit(self, name):
+        with self._lock:
+            if self._habits.pop(name, None) is not None:
+                self._archived.pop(name, None)
+                self._dirty.discard(name)
+                self._changes.append(('delete', name))
+
+    def load_habit(self, name, start=None, end=None):
+        with self._lock:
+            row = self._habits.get(name)
+            if row is None:
+                return None
+            return (row[0], row[1], row[2], row[3], self._history(name, row, start, end))
+
+    def load_summary(self, name):
+        with self._lock:
+            row = self._habits.get(name)
+            return None if row is None else (row[0], list(row[4]), row[3])
+
+    def list_habits(self, period=None):
+        with self._lock:
+            rows = [(row[0], row[1], row[2], row[3], json.dumps(list(self._archived.get(row[0], ())) + row[4]))
+                    for row in self._habits.values() if period is None or row[3] == period]
+        return list(self.COLUMNS), rows
+
+    def iter_rows(self, period=None, chunk_size=1000):
+        with self._lock:
+            rows = [(row[0], row[1], row[2], row[3], json.dumps(list(self._archived.get(row[0], ())) + row[4]), row[5], row[6])
+                    for row in self._habits.values() if period is None or row[3] == period]
+        for start in range(0, len(rows), chunk_size):
+            yield rows[start:start + chunk_size]
+
+    def completed_dates(self, name, period=None, start=None, end=None):
+        with self._lock:
+            row = self._habits.get(name)
+            if row is None or (period is not None and row[3] != period):
+                return None
+            return self._history(name, row, start, end)
+
+    def habit_info(self, name):
+        with self._lock:
+            row = self._habits.get(name)
+            return None if row is None else (row[3], row[2])
+
+    def history_stamp(self, name):
+        with self._lock:
+            row = self._habits.get(name)
+            if row is None:
+                return None
+            # This backend is the only writer of its habits, so the number of completions is enough
+            return len(row[4]) + len(self._archived.get(name, ()))
+
+    def add_completion(self, name, date):
+        with self._lock:
+            row = self._habits.get(name)
+            if row is None:
+                return None
+            archived = self._archived.get(name, {})
+            previous = len(row[4]) + len(archived)
+            if date not in row[4] and to_iso_date(date) not in archived:    # Avoid duplicate entries, also of archived dates
+                row[4].append(date)
+                self._touch(name)
+            return list(row[4]), (previous, len(row[4]) + len(archived))
+
+    def streaks(self, name, period):
+        with self._lock:
+            row = self._habits.get(name)
+            if row is None or row[3] != period:
+                return None
+            return (row[0], row[5], row[6])
+
+    def set_streaks(self, name, current_streak, longest_streak):
+        with self._lock:
+            row = self._habits.get(name)
+            if row is not None:
+                row[5], row[6] = current_streak, longest_streak
+                self._touch(name)
+
+    def longest_streak(self):
+        with self._lock:
+            if not self._habits:
+                return None
+            # Same order as ORDER BY longest_streak DESC: NULL sorts last, ties keep insertion order
+            row = max(self._habits.values(), key=lambda row: (row[6] is not None, row[6] or 0))
+            return (row[6], row[0])
+
+    def habit_summaries(self):
+        with self._lock:
+            return [(row[0], row[3], row[2], len(row[4]) + len(self._archived.get(row[0], ())), row[5], row[6])
+                    for row in self._habits.values()]
@@ -0,0 +1,285 @@
+from bisect import bisect_right
+from collections import Counter
+from datetime import date
+
+
+def date_ordinal(value):
+    """
+    Convert a "YYYY-M-D" date string (zero padding optional) to a day ordinal.
+
+    Args:
+        value (str): The date string.
+
+    Returns:
+        int: The proleptic Gregorian ordinal of the date.
+    """
+    year, month, day = value.split('-')
+    return date(int(year), int(month), int(day)).toordinal()
+
+
+def as_ordinal(value):
+    """
+    Convert a "YYYY-M-D" date string, a date or a day ordinal to a day ordinal.
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, date):
+        return value.toordinal()
+    return date_ordinal(value)
+
+
+class StreakSegments:
+    """
+    A habit's completion history kept as sorted run-length segments.
+
+    A segment (start, end) is a maximal run of completions where each completion follows
+    the previous one after exactly `step` days, which is the rule compute_streak() uses.
+    Segments are kept in two parallel sorted lists, so a date is located with a binary
+    search and inserting it only merges or splits the segments around it. The current
+    and longest streaks are then available without rescanning the history.
+
+    Attributes:
+        step (int): The number of days between consecutive completions in a streak.
+        starts (list): The first day ordinal of each segment, sorted.
+        ends (list): The last day ordinal of each segment, in the same order.
+        count (int): The number of distinct completed dates.
+    """
+
+    __slots__ = ('step', 'starts', 'ends', 'count', '_lengths', '_longest')
+
+    def __init__(self, step=1):
+        self.step = step
+        self.starts = []
+        self.ends = []
+        self.count = 0
+        self._lengths = Counter()   # Segment length -> number of segments with that length
+        self._longest = 0
+
+    @classmethod
+    def from_dates(cls, dates, step=1):
+        """
+        Build the segments from a list of date strings in one sorted pass.
+
+        Args:
+            dates (iterable): The completed dates as "YYYY-M-D" strings.
+            step (int): The number of days between consecutive completions in a streak.
+
+        Returns:
+            StreakSegments: The segments covering the dates.
+        """
+        segments = cls(step)
+        for ordinal in sorted({date_ordinal(d) for d in dates}):
+            if segments.ends and ordinal - segments.ends[-1] == step:
+                segments.ends[-1] = ordinal
+            else:
+                segments.starts.append(ordinal)
+                segments.ends.append(ordinal)
+        segments.count = sum((e - s) // step + 1 for s, e in zip(segments.starts, segments.ends))
+        segments._lengths = Counter((e - s) // step + 1 for s, e in zip(segments.starts, segments.ends))
+        segments._longest = max(segments._lengths, default=0)
+        return segments
+
+    def _length(self, i):
+        return (self.ends[i] - self.starts[i]) // self.step + 1
+
+    def _forget(self, length):
+        self._lengths[length] -= 1
+        if not self._lengths[length]:
+            del self._lengths[length]
+            if length == self._longest:     # Only a split can shrink the longest streak
+                self._longest = max(self._lengths, default=0)
+
+    def _remember(self, length):
+        self._lengths[length] += 1
+        self._longest = max(self._longest, length)
+
+    def __contains__(self, value):
+        ordinal = date_ordinal(value) if isinstance(value, str) else value
+        i = bisect_right(self.starts, ordinal) - 1
+        return i >= 0 and ordinal <= self.ends[i] and (ordinal - self.starts[i]) % self.step == 0
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, value):
+        """
+        Insert a completed date, merging or splitting the neighbouring segments.
+
+        Args:
+            value (str or int): The date as a "YYYY-M-D" string or a day ordinal.
+
+        Returns:
+            bool: True if the date was new, False if it was already recorded.
+        """
+        ordinal = date_ordinal(value) if isinstance(value, str) else value
+        step = self.step
+        starts, ends = self.starts, self.ends
+        i = bisect_right(starts, ordinal) - 1     # Last segment starting on or before the date
+
+        if i >= 0 and ordinal <= ends[i]:
+            start, end = starts[i], ends[i]
+            if (ordinal - start) % step == 0:
+                return False    # Already completed on that date
+            # The date falls between two completions of a weekly run and breaks it in three
+            before = start + (ordinal - start) // step * step
+            self._forget(self._length(i))
+            ends[i] = before
+            starts[i + 1:i + 1] = [ordinal, before + step]
+            ends[i + 1:i + 1] = [ordinal, end]
+            for j in (i, i + 1, i + 2):
+                self._remember(self._length(j))
+            self.count += 1
+            return True
+
+        joins_left = i >= 0 and ordinal - ends[i] == step
+        joins_right = i + 1 < len(starts) and starts[i + 1] - ordinal == step
+        if joins_left and joins_right:
+            self._forget(self._length(i))
+            self._forget(self._length(i + 1))
+            ends[i] = ends[i + 1]
+            del starts[i + 1]
+            del ends[i + 1]
+            self._remember(self._length(i))
+        elif joins_left:
+            self._forget(self._length(i))
+            ends[i] = ordinal
+            self._remember(self._length(i))
+        elif joins_right:
+            self._forget(self._length(i + 1))
+            starts[i + 1] = ordinal
+            self._remember(self._length(i + 1))
+        else:
+            starts.insert(i + 1, ordinal)
+            ends.insert(i + 1, ordinal)
+            self._remember(1)
+        self.count += 1
+        return True
+
+    @property
+    def current_streak(self):
+        """
+        The length of the most recent segment, as compute_streak() reports it.
+        """
+        return self._length(-1) if self.starts else 0
+
+    @property
+    def longest_streak(self):
+        """
+        The length of the longest segment.
+        """
+        return self._longest
+
+
+class CompletionIndex:
+    """
+    A habit's completions as a Fenwick tree of cumulative counts by day ordinal.
+
+    Counting the completions in any date range takes two prefix sums, O(log n) in the
+    number of days covered, however long the history is. Adding a completion is also
+    O(log n); a date outside the covered days rebuilds the tree with room to spare, so
+    check-offs on new days are usually absorbed without a rebuild.
+
+    Attributes:
+        origin (int): The day ordinal stored at position 1 of the tree, or None if empty.
+        total (int): The number of distinct completed dates.
+    """
+
+    __slots__ = ('origin', 'total', '_tree', '_days')
+
+    HEADROOM = 366  # Spare days reserved after the last completion when the tree is (re)built
+
+    def __init__(self):
+        self.origin = None
+        self.total = 0
+        self._tree = [0]
+        self._days = set()
+
+    @classmethod
+    def from_dates(cls, dates):
+        """
+        Build the index from a list of date strings in linear time.
+
+        Args:
+            dates (iterable): The completed dates as "YYYY-M-D" strings.
+
+        Returns:
+            CompletionIndex: The index of the dates.
+        """
+        index = cls()
+        index._build({date_ordinal(d) for d in dates})
+        return index
+
+    def _build(self, days):
+        self._days = days
+        self.total = len(days)
+        if not days:
+            self.origin, self._tree = None, [0]
+            return
+        self.origin = min(days)
+        size = max(days) - self.origin + 1 + self.HEADROOM
+        tree = [0] * (size + 1)
+        for day in days:
+            tree[day - self.origin + 1] = 1
+        for i in range(1, size + 1):    # Push each partial sum up to its parent
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def add(self, value):
+        """
+        Record a completed date.
+
+        Args:
+            value (str, date or int): The date as a "YYYY-M-D" string, a date or a day ordinal.
+
+        Returns:
+            bool: True if the date was new, False if it was already recorded.
+        """
+        ordinal = as_ordinal(value)
+        if ordinal in self._days:
+            return False
+        tree = self._tree
+        i = ordinal - self.origin + 1 if self.origin is not None else 0
+        if not 1 <= i < len(tree):
+            self._build(self._days | {ordinal})
+            return True
+        self._days.add(ordinal)
+        self.total += 1
+        while i < len(tree):
+            tree[i] += 1
+            i += i & -i
+        return True
+
+    def _prefix(self, ordinal):
+        """
+        Return the number of completions on or before a day ordinal.
+        """
+        if self.origin is None or ordinal < self.origin:
+            return 0
+        i = min(ordinal - self.origin + 1, len(self._tree) - 1)
+        count = 0
+        while i > 0:
+            count += self._tree[i]
+            i -= i & -i
+        return count
+
+    def count(self, start=None, end=None):
+        """
+        Return the number of completions between two dates, inclusive.
+
+        Args:
+            start (str, date or int, optional): The first day counted. Defaults to the first completion.
+            end (str, date or int, optional): The last day counted. Defaults to the last completion.
+        """
+        if self.origin is None:
+            return 0
+        high = self.total if end is None else self._prefix(as_ordinal(end))
+        low = 0 if start is None else self._prefix(as_ordinal(start) - 1)
+        return max(0, high - low)
+
+    def __contains__(self, value):
+        return as_ordinal(value) in self._days
+
+    def __len__(self):
+        return self.total
@@ -1,9 +1,27 @@
 import unittest
 import sqlite3
-from datetime import datetime
+import csv
+import gzip
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
 from habit_tracker import Habit
 import json
 from main import create_habit
+from view import export_table_data
+from loadtest import run_load_test, percentile
+from streaks import StreakSegments
+from tiering import archive_cold_history
+from db import archive_path, create_change_feed, create_history_version, create_table
+from changefeed import register_consumer, unregister_consumer, iter_batches, read_changes, acknowledge
+from storage import MemoryBackend, SQLiteBackend
+from analytics import build_bitsets, co_completion_report, shift_days
+from sketches import HyperLogLog, KLLSketch, PopulationStats, load_sketches, merge_databases, summarize
+from client import CommandError, build_parser, call, send
+from daemon import start_in_thread
+from migrations import MIGRATIONS, current_version, migrate
+from sqlstreaks import compute_streaks_sql
 from unittest.mock import patch
 
 
@@ -31,6 +49,7 @@ class TestHabit(unittest.TestCase):
                                 )
                             """)
             conn.commit()
+            create_history_version(conn)
 
         # Create a Habit instances for testing
         self.habit = Habit()
@@ -262,6 +281,559 @@ class TestHabit(unittest.TestCase):
         self.assertEqual(result[0], 2, "The current streak was not calculated correctly.")
         self.assertEqual(result[1], 4, "The longest streak was not calculated correctly.")
 
+    def test_export_table_data(self):
+        """
+        Test streaming the habit table and its completions to CSV and JSONL.
+        """
+        with sqlite3.connect(self.test_db) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''INSERT INTO habit (name, description, period, completed_dates) VALUES (?,?,?,?) ''',
+                (self.habit4.name, self.habit4.description, self.habit4.period, self.habit4.completed_dates))
+            conn.commit()
+
+        # Export only the name and period columns as CSV
+        export_path = 'test_export.csv'
+        self.addCleanup(os.remove, export_path)
+        count = export_table_data(self.test_db, 'habit', export_path, 'csv', columns=['name', 'period'], chunk_size=1)
+        with open(export_path, newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(count, 1, "The wrong number of rows was exported.")
+        self.assertEqual(rows, [['name', 'period'], ['Weekly Streak Habit', 'Weekly']])
+
+        # Export one JSON line per completed date, gzip-compressed
+        export_path = 'test_export.jsonl.gz'
+        self.addCleanup(os.remove, export_path)
+        count = export_table_data(self.test_db, 'habit', export_path, 'jsonl',
+                                  columns=['name', 'completed_date'], completions=True, compress=True)
+        with gzip.open(export_path, 'rt') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(count, 6, "Each completed date should be exported as its own row.")
+        self.assertEqual(lines[0], {'name': 'Weekly Streak Habit', 'completed_date': '2023-1-01'})
+
+        # Unknown columns are rejected rather than interpolated into the query
+        with self.assertRaises(ValueError):
+            export_table_data(self.test_db, 'habit', export_path, 'csv', columns=['name; DROP TABLE habit'])
+
+    def test_load_many(self):
+        """
+        Test bulk loading habits as slotted records with lazily decoded completed dates.
+        """
+        with sqlite3.connect(self.test_db) as conn:
+            cursor = conn.cursor()
+            for habit in (self.habit3, self.habit4):
+                cursor.execute(
+                    '''INSERT INTO habit (name, description, period, completed_dates) VALUES (?,?,?,?) ''',
+                    (habit.name, habit.description, habit.period, habit.completed_dates))
+            conn.commit()
+
+        with patch.object(Habit, '_DB_NAME', self.test_db):
+            records = Habit.load_many(period='Weekly')
+
+        self.assertEqual([record.name for record in records], ['Weekly Streak Habit'])
+        record = records[0]
+        self.assertFalse(hasattr(record, '__dict__'), "HabitRecord should not carry a per-instance __dict__.")
+        self.assertIsInstance(record._raw_completed_dates, str, "Completed dates should stay encoded until accessed.")
+        self.assertEqual(len(record.completed_dates), 6)
+        self.assertIs(record.completed_dates, record.completed_dates, "Completed dates should only be decoded once.")
+
+    def test_load_non_date_entries(self):
+        """
+        Test that entries which are not dates are kept as stored instead of failing the read.
+        """
+        with sqlite3.connect(self.test_db) as conn:
+            conn.execute('''INSERT INTO habit (name, description, period, completed_dates) VALUES (?,?,?,?) ''',
+                         (self.habit2.name, self.habit2.description, 'Daily', '["2023-1-01", "skipped", 7, "2023-01-01"]'))
+
+        with patch.object(Habit, '_DB_NAME', self.test_db):
+            self.assertEqual(Habit.load_one(self.habit2.name).completed_dates, ['2023-01-01', 'skipped', 7])
+            self.assertEqual(Habit.load_completed_dates(self.habit2.name, 'Daily', start='2023-1-01'), ['2023-01-01'])
+
+    def test_concurrent_mark_complete(self):
+        """
+        Test that concurrent check-offs of the same habit never lose a completed date.
+        """
+        self.habit5.save_weekly()
+        n_threads, n_dates = 16, 10
+        errors = []
+
+        def check_off(thread_number):
+            # Every thread works from its own stale copy of the habit, as separate processes would
+            habit = Habit(name=self.habit5.name, completed_dates='[]')
+            habit._DB_NAME = self.test_db
+            habit._MAX_RETRIES = 50
+            try:
+                for day in range(n_dates):
+                    habit.mark_complete(f"2023-{thread_number + 1:02d}-{day + 1:02d}")
+            except sqlite3.Error as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=check_off, args=(i,)) for i in range(n_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with sqlite3.connect(self.test_db) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT completed_dates FROM habit WHERE name = ?", (self.habit5.name,))
+            completed_dates = json.loads(cursor.fetchone()[0])
+
+        self.assertEqual(errors, [], "Check-offs failed under contention.")
+        self.assertEqual(len(completed_dates), n_threads * n_dates, "Concurrent check-offs lost updates.")
+        self.assertEqual(len(set(completed_dates)), n_threads * n_dates)
+
+    def test_run_load_test(self):
+        """
+        Test replaying a small seeded workload and reporting latency percentiles.
+        """
+        report = run_load_test(n_users=3, habits_per_user=2, history_days=30, workers=2, ops_per_worker=25, seed=1)
+        summary = report['summary']
+
+        self.assertEqual(summary['errors'], 0, f"Operations failed: {summary['error_samples']}")
+        self.assertEqual(summary['total_ops'], 50, "Every replayed operation should be timed.")
+        for stats in summary['operations'].values():
+            self.assertLessEqual(stats['p50_ms'], stats['p95_ms'])
+            self.assertLessEqual(stats['p95_ms'], stats['p99_ms'])
+        self.assertEqual(Habit._DB_NAME, 'main.db', "The load tester should restore the database name.")
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+
+        # The same workload against the in-memory backend, with its settings in the report
+        report = run_load_test(n_users=3, habits_per_user=2, history_days=30, workers=2, ops_per_worker=25, seed=1,
+                               storage='memory', busy_timeout=1.0)
+        self.assertEqual(report['summary']['errors'], 0, f"Operations failed: {report['summary']['error_samples']}")
+        self.assertEqual((report['config']['storage'], report['config']['busy_timeout']), ('memory', 1.0))
+        self.assertIsNone(Habit._storage, "The load tester should restore the storage backend.")
+        self.assertEqual(Habit._BUSY_TIMEOUT, 5.0)
+        with self.assertRaises(ValueError):
+            run_load_test(storage='memory', use_processes=True)
+
+    def test_update_streaks_incremental(self):
+        """
+        Test updating streaks from run-length segments when a missing date is backfilled.
+        """
+        with sqlite3.connect(self.test_db) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''INSERT INTO habit (name, description, period, completed_dates) VALUES (?,?,?,?) ''',
+                (self.habit3.name, self.habit3.description, self.habit3.period, self.habit3.completed_dates))
+            conn.commit()
+
+        with patch.object(Habit, '_DB_NAME', self.test_db):
+            self.addCleanup(Habit._forget_cached_history, self.test_db, self.habit3.name)
+            self.assertEqual(Habit.update_streaks_incremental(self.habit3.name, '2023-1-29', 1), (12, 16))
+
+            # 2023-1-17 is the only gap; backfilling it joins both runs
+            self.habit3.mark_complete('2023-1-17')
+            self.assertEqual(len(Habit.load_streak_segments(self.habit3.name, 1)), 1,
+                             "mark_complete should keep the cached segments in sync.")
+            self.assertEqual(Habit.update_streaks_incremental(self.habit3.name, '2023-1-17', 1), (29, 29))
+            _, current_streak, longest_streak = Habit.load_streaks(self.habit3.name, 'Daily')
+
+            # A check-off written by another process is noticed through the history stamp
+            other = Habit(name=self.habit3.name)
+            with patch.object(Habit, '_streak_cache', {}):
+                other.mark_complete('2023-1-30')
+            self.assertEqual(Habit.load_streak_segments(self.habit3.name, 1).current_streak, 30,
+                             "Cached segments should be rebuilt after another writer changed the history.")
+
+        self.assertEqual((current_streak, longest_streak), (29, 29), "The streaks were not written back.")
+
+        # A completion between two weekly check-offs splits their run
+        segments = StreakSegments.from_dates(json.loads(self.habit4.completed_dates), 7)
+        self.assertEqual((segments.current_streak, segments.longest_streak), (2, 4))
+        segments.add('2023-1-10')
+        self.assertEqual((segments.current_streak, segments.longest_streak), (2, 2))
+
+    def test_count_completions(self):
+        """
+        Test counting completions and completion rates over date ranges from the prefix-sum index.
+        """
+        with sqlite3.connect(self.test_db) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''INSERT INTO habit (name, description, period, completed_dates) VALUES (?,?,?,?) ''',
+                (self.habit3.name, self.habit3.description, self.habit3.period, self.habit3.completed_dates))
+            conn.commit()
+
+        with patch.object(Habit, '_DB_NAME', self.test_db):
+            self.addCleanup(Habit._forget_cached_history, self.test_db, self.habit3.name)
+            self.assertEqual(Habit.count_completions(self.habit3.name), 28)
+            self.assertEqual(Habit.count_completions(self.habit3.name, '2023-1-10', date(2023, 1, 20)), 10)
+            self.assertEqual(Habit.count_completions(self.habit3.name, end='2022-12-31'), 0)
+            self.assertEqual(Habit.completion_rate(self.habit3.name, '2023-1-01', '2023-1-20'), 19 / 20)
+
+            # Check-offs before and after the indexed days keep the cached index in sync
+            self.habit3.mark_complete('2022-12-31')
+            self.habit3.mark_complete('2024-06-01')
+            self.assertEqual(Habit.count_completions(self.habit3.name, end='2023-1-01'), 2)
+            self.assertEqual(Habit.count_completions(self.habit3.name, '2023-2-01'), 1)
+            self.assertEqual(Habit.completion_rate(self.habit3.name, '2024-05-26', '2024-06-01', 7), 1.0)
+            self.assertEqual(Habit.count_completions('Unknown Habit'), 0)
+            self.assertNotIn((self.test_db, 'Unknown Habit'), Habit._count_cache, "Misses should not be cached.")
+
+            # A check-off by another process is noticed through the history stamp
+            SQLiteBackend(self.test_db).add_completion(self.habit3.name, '2024-06-02')
+            self.assertEqual(Habit.count_completions(self.habit3.name, '2024-06-01'), 2)
+            with sqlite3.connect(self.test_db) as conn:
+                conn.execute("INSERT INTO habit (name, description, period, completed_dates) VALUES ('Unknown Habit', 'Created elsewhere', 'Daily', '[\"2024-06-01\"]')")
+            self.addCleanup(Habit._forget_cached_history, self.test_db, 'Unknown Habit')
+            self.assertEqual(Habit.count_completions('Unknown Habit'), 1)
+
+    def test_compute_streaks_sql(self):
+        """
+        Test computing streaks with window functions inside SQLite and writing them back.
+        """
+        with sqlite3.connect(self.test_db) as conn:
+            cursor = conn.cursor()
+            for habit in (self.habit3, self.habit4):
+                cursor.execute(
+                    '''INSERT INTO habit (name, description, period, completed_dates) VALUES (?,?,?,?) ''',
+                    (habit.name, habit.description, habit.period, habit.completed_dates))
+            conn.commit()
+
+        self.assertEqual(compute_streaks_sql(self.test_db, self.habit4.name, write=False), {self.habit4.name: (2, 4)})
+        self.assertEqual(compute_streaks_sql(self.test_db),
+                         {self.habit3.name: (12, 16), self.habit4.name: (2, 4)})
+        with patch.object(Habit, '_DB_NAME', self.test_db):
+            self.assertEqual(Habit.load_streaks(self.habit3.name, 'Daily'), (self.habit3.name, 12, 16))
+            self.assertEqual(Habit.load_streaks(self.habit4.name, 'Weekly'), (self.habit4.name, 2, 4))
+
+    def test_archive_cold_history(self):
+        """
+        Test moving old completions into the archive database and reading them back.
+        """
+        with sqlite3.connect(self.test_db) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''INSERT INTO habit (name, description, period, completed_dates) VALUES (?,?,?,?) ''',
+                (self.habit3.name, self.habit3.description, self.habit3.period, self.habit3.completed_dates))
+            conn.commit()
+        self.addCleanup(os.remove, archive_path(self.test_db))
+        self.addCleanup(lambda: sqlite3.connect(self.test_db).execute('DROP TABLE IF EXISTS habit_archive'))
+
+        result = archive_cold_history(self.test_db, horizon_days=10, today=date(2023, 1, 25))
+        self.assertEqual(result['archived'], 14, "Completions before 2023-01-15 should be archived.")
+
+        with sqlite3.connect(self.test_db) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT completed_dates FROM habit WHERE name = ?", (self.habit3.name,))
+            self.assertEqual(len(json.loads(cursor.fetchone()[0])), 14, "Only the hot dates should stay in the habit table.")
+            cursor.execute("SELECT archived_count, first_date, last_date FROM habit_archive WHERE name = ?", (self.habit3.name,))
+            self.assertEqual(cursor.fetchone(), (14, '2023-01-01', '2023-01-14'))
+
+        with patch.object(Habit, '_DB_NAME', self.test_db):
+            self.assertEqual(len(Habit.load_completed_dates(self.habit3.name, 'Daily')), 28,
+                             "Full-history reads should include archived completions.")
+            self.assertEqual(len(Habit.load_completed_dates(self.habit3.name, 'Daily', start='2023-1-20')), 10)
+            self.assertEqual(Habit.load_one(self.habit3.name, start='2023-1-10', end='2023-1-16').completed_dates,
+                             ['2023-01-10', '2023-01-11', '2023-01-12', '2023-01-13', '2023-01-14', '2023-01-15', '2023-01-16'])
+
+            # Bulk loads, listings and exports include the archived completions as well
+            self.assertEqual(len(Habit.load_many()[0].completed_dates), 28)
+            self.assertEqual(len(json.loads(Habit.load_whole_list()[1][0][4])), 28)
+            export_path = 'test_export_archive.csv'
+            self.addCleanup(os.remove, export_path)
+            self.assertEqual(export_table_data(self.test_db, 'habit', export_path, columns=['name', 'completed_date'], completions=True), 28)
+
+            # Checking off an archived date again does not copy it back into the habit table
+            self.habit3.mark_complete('2023-1-05')
+            self.assertEqual(len(Habit.load_completed_dates(self.habit3.name, 'Daily')), 28)
+
+            # Renaming a habit keeps its archived history
+            self.habit3.update('Renamed Streak Habit', self.habit3.description, self.habit3.name)
+            self.assertEqual(len(Habit.load_one('Renamed Streak Habit').completed_dates), 28)
+
+    def test_co_completion_report(self):
+        """
+        Test finding habits completed together, crowding each other out and following each other.
+        """
+        days = [str(date(2023, 1, 1) + timedelta(days=i)) for i in range(56)]
+        histories = {
+            'Run': days[0::2],
+            'Stretch': days[0::2],
+            'Sleep In': days[1::2],
+            'Ice Bath': days[1::2][:20],
+        }
+        report = co_completion_report(histories, k=1, lags=(1,))
+
+        self.assertEqual(report['days'], 56)
+        self.assertEqual(report['together'][0], {'a': 'Run', 'b': 'Stretch', 'score': 1.0})
+        self.assertLess(report['crowding_out'][0]['score'], -0.9, "Alternating habits should be anti-correlated.")
+        self.assertIn(report['followed_by_lag_1'][0]['a'], ('Run', 'Stretch'))
+
+        # The bit shift used for lags carries across 64-day words
+        first = date(2023, 1, 1)
+        _, matrix, _, n_days = build_bitsets({'Habit': [str(first + timedelta(days=day)) for day in (0, 64, 65)]})
+        self.assertEqual((n_days, matrix.shape[1]), (66, 2))
+        shifted = shift_days(matrix, 1)
+        self.assertEqual(int(shifted[0, 0]), 1 << 63, "Day 64 should carry into the top bit of word 0.")
+        self.assertEqual(int(shifted[0, 1]), 1, "Day 65 should land in bit 0 of word 1.")
+
+    def test_change_feed(self):
+        """
+        Test that habit changes are recorded in the change feed and truncated once acknowledged.
+        """
+        with sqlite3.connect(self.test_db) as conn:
+            create_change_feed(conn)
+        self.addCleanup(lambda: sqlite3.connect(self.test_db).executescript(
+            'DROP TABLE IF EXISTS habit_change; DROP TABLE IF EXISTS change_consumer; DROP TABLE IF EXISTS change_feed_pause'))
+
+        self.habit3.save_daily()
+        self.assertEqual(read_changes(self.test_db, 0), [], "Nothing should be recorded without consumers.")
+        register_consumer(self.test_db, 'reports')
+        register_consumer(self.test_db, 'backup')
+        self.habit1.save_weekly()
+        self.habit1.mark_complete('2023-1-01')
+        with patch.object(Habit, '_DB_NAME', self.test_db):
+            Habit.update_streaks(1, 1, self.habit1.name)
+        # Moving the date into the archive is not a check-off
+        self.addCleanup(os.remove, archive_path(self.test_db))
+        self.addCleanup(lambda: sqlite3.connect(self.test_db).execute('DROP TABLE IF EXISTS habit_archive'))
+        self.assertEqual(archive_cold_history(self.test_db, horizon_days=10, today=date(2023, 6, 1))['archived'], 1)
+        self.habit1.update('Renamed Weekly Habit', 'New description', self.habit1.name)
+        self.habit1.name = 'Renamed Weekly Habit'
+        self.habit1.delete()
+
+        batches = list(iter_batches(self.test_db, 'reports', batch_size=2))
+        changes = [change for batch in batches for change in batch]
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual([change['operation'] for change in changes],
+                         ['save', 'mark_complete', 'update_streaks', 'update', 'delete'])
+        self.assertEqual(changes[1]['data'], {'added_dates': ['2023-1-01']}, "Only the added date should be recorded.")
+        self.assertEqual(changes[3]['data']['previous_name'], 'Weekly Habit')
+        self.assertEqual([change['seq'] for change in changes], sorted(change['seq'] for change in changes))
+
+        # Changes are only deleted once every registered consumer has acknowledged them
+        self.assertEqual(acknowledge(self.test_db, 'reports', changes[-1]['seq']), 0)
+        self.assertEqual(read_changes(self.test_db, 0, limit=10), changes)
+        self.assertEqual(acknowledge(self.test_db, 'backup', changes[1]['seq']), 2)
+        self.assertEqual(read_changes(self.test_db, 0, limit=10), changes[2:])
+        self.assertEqual(list(iter_batches(self.test_db, 'reports')), [])
+
+        # The last consumer to leave takes the unread changes with it
+        unregister_consumer(self.test_db, 'reports')
+        self.assertEqual(len(read_changes(self.test_db, 0)), 3)
+        unregister_consumer(self.test_db, 'backup')
+        self.assertEqual(read_changes(self.test_db, 0), [])
+
+    def test_memory_backend(self):
+        """
+        Test the in-memory storage engine and its SQLite snapshots.
+        """
+        snapshot = 'test_snapshot_db'
+        self.addCleanup(os.remove, snapshot)
+        storage = MemoryBackend(snapshot, checkpoint_interval=None)
+        previous = Habit.use_storage(storage)
+        self.addCleanup(Habit.use_storage, previous)
+
+        self.habit2.save_daily()
+        self.habit2.mark_complete('2023-1-01')
+        self.habit2.mark_complete('2023-1-02')
+        self.assertEqual(Habit.update_streaks_incremental(self.habit2.name, '2023-1-02', 1), (2, 2))
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.habit2.save_daily()
+        self.assertEqual(Habit.load_streaks(self.habit2.name, 'Daily'), ('Daily Habit', 2, 2))
+        self.assertEqual(Habit.load_one(self.habit2.name).completed_dates, ['2023-01-01', '2023-01-02'])
+        self.assertEqual(sqlite3.connect(snapshot).execute('SELECT * FROM habit').fetchall(), [],
+                         "Nothing should be written before a checkpoint.")
+
+        # A checkpoint writes the changed habits to SQLite, and a new engine restores them
+        self.assertEqual(storage.checkpoint(), 1)
+        self.habit2.update('Renamed Daily Habit', 'New description', self.habit2.name)
+        storage.close()
+        restored = MemoryBackend(snapshot, checkpoint_interval=None)
+        Habit.use_storage(restored)
+        self.assertIsNone(Habit.load_one('Daily Habit'))
+        habit = Habit.load_one('Renamed Daily Habit')
+        self.assertEqual((habit.description, habit.completed_dates), ('New description', ['2023-01-01', '2023-01-02']))
+        self.assertEqual(Habit.load_longest_streak(), (2, 'Renamed Daily Habit'))
+        restored.close()
+
+        # Archived history is restored too, and a checkpointed rename keeps it with the habit
+        self.addCleanup(os.remove, archive_path(snapshot))
+        self.assertEqual(archive_cold_history(snapshot, horizon_days=10, today=date(2023, 6, 1))['archived'], 2)
+        archived = MemoryBackend(snapshot, checkpoint_interval=None)
+        Habit.use_storage(archived)
+        self.assertEqual(Habit.load_one('Renamed Daily Habit').completed_dates, ['2023-01-01', '2023-01-02'])
+        self.habit2.update('Archived Daily Habit', 'New description', 'Renamed Daily Habit')
+        archived.close()
+        self.assertEqual(SQLiteBackend(snapshot).completed_dates('Archived Daily Habit'), ['2023-01-01', '2023-01-02'])
+
+    def test_population_sketches(self):
+        """
+        Test the quantile and distinct count sketches and their persistence across database files.
+        """
+        values = list(range(20000))
+        left, right = KLLSketch(seed=1), KLLSketch(seed=2)
+        for v in values[::2]:
+            left.update(v)
+        for v in values[1::2]:
+            right.update(v)
+        left.merge(right)
+        self.assertEqual(left.n, len(values))
+        for q in (0.5, 0.9, 0.99):
+            self.assertAlmostEqual(left.quantile(q) / len(values), q, delta=0.02)
+        counter, other = HyperLogLog(), HyperLogLog()
+        for i in range(6000):
+            counter.add(f"habit {i}")
+            other.add(f"habit {i + 3000}")
+        counter.merge(other)
+        self.assertAlmostEqual(counter.count(), 9000, delta=9000 * 0.05)
+
+        stats = PopulationStats(self.test_db)
+        self.addCleanup(stats.close)
+        previous = Habit.use_stats(stats)
+        self.addCleanup(Habit.use_stats, previous)
+        self.addCleanup(os.remove, 'test_other_db')
+        today = str(date.today())
+        with patch.object(Habit, '_DB_NAME', self.test_db):
+            self.habit1.save_weekly()
+            self.habit2.save_daily()
+            self.habit1.mark_complete(today)
+            self.habit2.mark_complete(today)
+            Habit.update_streaks(3, 5, self.habit2.name)
+            Habit.update_streaks(1, 1, self.habit1.name)
+        summary = stats.summary()
+        self.assertEqual(summary['habits_checked_off:All'], {'distinct': 2})
+        self.assertEqual(summary['active_days:Daily'], {'distinct': 1})
+        self.assertNotIn('current_streak:Daily', summary, "Quantiles are only rebuilt by rebuild(), not on check-off.")
+        stats.rebuild()
+        summary = stats.summary()
+        self.assertEqual(summary['current_streak:Daily'], {'n': 1, 'p50': 3, 'p90': 3, 'p99': 3})
+        self.assertEqual(summary['longest_streak:All']['n'], 2)
+        self.assertEqual(summary['completion_rate:Daily']['p50'], 1.0)
+        self.assertEqual(summary['habits_checked_off:All'], {'distinct': 2})
+
+        # One value per habit, however often a habit is updated
+        with patch.object(Habit, '_DB_NAME', self.test_db):
+            for i in range(9):
+                Habit(name=f"Habit {i}", description="Short streak").save_daily()
+                Habit.update_streaks(1, 1, f"Habit {i}")
+            for streak in range(4, 101):
+                Habit.update_streaks(streak, streak, self.habit2.name)
+        stats.rebuild()
+        summary = stats.summary()
+        self.assertEqual(summary['current_streak:Daily'], {'n': 10, 'p50': 1, 'p90': 1, 'p99': 100})
+        self.assertEqual(summary['completion_rate:Daily']['n'], 10)
+        self.assertEqual(summary['completion_rate:Daily']['p50'], 0.0)
+
+        # Sketches of another database file merge into this one, once however often it is merged
+        with sqlite3.connect('test_other_db') as conn:
+            create_table(conn)
+        other = Habit(name='Other Habit', description='Other device')
+        other_stats = PopulationStats('test_other_db')
+        self.addCleanup(other_stats.close)
+        with patch.object(Habit, '_DB_NAME', 'test_other_db'), patch.object(Habit, '_stats', other_stats):
+            other.save_daily()
+            other.mark_complete(today)
+            Habit.update_streaks(7, 9, other.name)
+        other_stats.rebuild()
+        other_stats.flush()
+        merge_databases(self.test_db, ['test_other_db'])
+        merge_databases(self.test_db, ['test_other_db'])
+        summary = summarize(load_sketches(self.test_db))
+        self.assertEqual(summary['current_streak:Daily']['n'], 11)
+        self.assertEqual(summary['current_streak:Daily']['p99'], 100)
+        self.assertEqual(summary['longest_streak:Daily']['p90'], 9)
+        self.assertEqual(summary['habits_checked_off:Daily'], {'distinct': 2})
+        # Merging back does not count this database's own sketches twice
+        merge_databases('test_other_db', [self.test_db])
+        self.assertEqual(summarize(load_sketches('test_other_db'))['current_streak:Daily']['n'], 11)
+
+        # A background thread rebuilds the quantiles after changes
+        background = PopulationStats(self.test_db, rebuild_interval=0.01)
+        self.addCleanup(background.close)
+        with patch.object(Habit, '_DB_NAME', self.test_db):
+            Habit.update_streaks(50, 50, 'Habit 0')
+        background.changed()
+        for _ in range(500):
+            if summarize(load_sketches(self.test_db))['current_streak:Daily']['p90'] == 50:
+                break
+            time.sleep(0.01)
+        self.assertEqual(summarize(load_sketches(self.test_db))['current_streak:Daily']['p90'], 50)
+        with sqlite3.connect(self.test_db) as conn:
+            conn.execute('DROP TABLE habit_sketch')
+            conn.execute('DROP TABLE sketch_source')
+
+    def test_daemon(self):
+        """
+        Test that commands give the same results through the daemon and in-process.
+        """
+        path = 'test_daemon.sock'
+        backend = SQLiteBackend(self.test_db, persistent=True)   # As daemon.configure sets it up
+        with patch.object(Habit, '_DB_NAME', self.test_db), patch('daemon.configure'):
+            previous = Habit.use_storage(backend)
+            server = start_in_thread(path)
+            try:
+                self.assertEqual(send('ping', path=path), 'pong')
+                self.assertTrue(send('create', {'name': 'Daily Habit', 'description': 'Daemon'}, path))
+                self.assertEqual(send('check_off', {'name': 'Daily Habit', 'date': '2023-1-01'}, path), [1, 1])
+                self.assertIsNone(send('check_off', {'name': 'Daily Habit', 'period': 'Weekly'}, path))
+                with self.assertRaises(CommandError):
+                    send('create', {'name': 'Daily Habit', 'description': 'Duplicate'}, path)
+                with self.assertRaises(CommandError):
+                    send('unknown', path=path)
+            finally:
+                server.shutdown()
+                server.server_close()
+                Habit.use_storage(previous)
+                backend.close()
+            self.assertFalse(os.path.exists(path))
+
+            # Without a daemon the client runs the command itself, and sees what the daemon's connection wrote
+            self.assertEqual(call('check_off', {'name': 'Daily Habit', 'date': '2023-1-02'}, path=path), [2, 2])
+            # A date that is not one is refused before anything is written
+            with self.assertRaises(CommandError):
+                call('check_off', {'name': 'Daily Habit', 'date': 'tomorrow'}, path=path)
+            self.assertEqual(call('show', {'name': 'Daily Habit'}, path=path)['completed_dates'], ['2023-01-01', '2023-01-02'])
+            with self.assertRaises(SystemExit), patch('sys.stderr'):
+                build_parser().parse_args(['check-off', 'Daily Habit', '--date', 'tomorrow'])
+            self.assertEqual(call('streaks', {'name': 'Daily Habit'}, path=path), ['Daily Habit', 2, 2])
+            with self.assertRaises(CommandError):
+                call('create', {'name': 'Daily Habit', 'description': 'Duplicate'}, path=path)
+
+    def test_migrations(self):
+        """
+        Test upgrading a database in resumable batches, including after an interruption.
+        """
+        db_name = 'test_migrate_db'
+        self.addCleanup(os.remove, db_name)
+        with sqlite3.connect(db_name) as conn:
+            conn.execute('CREATE TABLE habit (name TEXT PRIMARY KEY, description TEXT NOT NULL, Date_and_Time_of_Creation DATETIME, period TEXT, completed_dates TEXT, current_streak INT, longest_streak INT)')
+            conn.executemany('INSERT INTO habit (name, description, period, completed_dates) VALUES (?,?,?,?)',
+                             [(f'Habit {i}', 'Old format', 'Daily', '["2023-1-01", "2023-01-01", "2023-1-2"]') for i in range(5)])
+        self.assertEqual(current_version(db_name), 0)
+        self.assertEqual(migrate(db_name, target=3), 3)   # Up to the change feed, so a consumer can watch the re-encoding
+        register_consumer(db_name, 'reports')
+
+        reports = []
+
+        def record(migration, batch, done, total, elapsed):
+            reports.append((migration.version, batch, done, total))
+            if len(reports) == 1:
+                raise KeyboardInterrupt     # Stop after the first committed batch
+
+        with self.assertRaises(KeyboardInterrupt):
+            migrate(db_name, batch_size=2, report=record)
+        self.assertEqual(current_version(db_name), 3, "The backfill should not be marked done.")
+        with sqlite3.connect(db_name) as conn:
+            self.assertIsNotNone(conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'habit_change_mark_complete'").fetchone(),
+                                 "The feed trigger should stay in place between batches.")
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM change_feed_pause").fetchone()[0], 0)
+
+        # The second run resumes after the last committed batch
+        self.assertEqual(migrate(db_name, batch_size=2, report=record), MIGRATIONS[-1].version)
+        self.assertEqual(reports, [(4, 1, 2, 5), (4, 1, 4, 5), (4, 2, 5, 5), (5, 1, 2, 5), (5, 2, 4, 5), (5, 3, 5, 5)])
+        with sqlite3.connect(db_name) as conn:
+            dates = {row[0] for row in conn.execute('SELECT completed_dates FROM habit')}
+            unversioned = conn.execute('SELECT COUNT(*) FROM habit WHERE history_version IS NULL').fetchone()[0]
+            feed = conn.execute("SELECT COUNT(*) FROM habit_change WHERE operation = 'mark_complete'").fetchone()[0]
+        self.assertEqual(dates, {'["2023-01-01", "2023-01-02"]'})
+        self.assertEqual(feed, 0, "Re-encoding dates is not a check-off.")
+        self.assertEqual(unversioned, 0)
+        self.assertEqual(migrate(db_name), MIGRATIONS[-1].version)
+
     def tearDown(self):
 
         with sqlite3.connect(self.test_db) as conn:
@@ -0,0 +1,97 @@
+import argparse
+import json
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from db import archive_path, create_archive_tables, pause_change_feed, resume_change_feed
+from habit_tracker import Habit
+from streaks import date_ordinal
+
+"""
+Cold History Tiering
+
+Moves completed dates older than a horizon out of the habit table's completed_dates JSON
+and into an archive database that is attached with ATTACH. A row of aggregates per habit
+(count, first and last archived date) stays behind in the main database, so reads that
+only look at recent dates never need to open the archive.
+
+Usage:
+    python tiering.py [--db main.db] [--horizon-days 90]
+"""
+
+
+def archive_cold_history(db_name, horizon_days=90, today=None, batch_size=200):
+    """
+    Move completions older than the horizon into the attached archive database.
+
+    Each batch of habits is moved in its own transaction, so writers are never
+    blocked for long and an interrupted run can simply be started again. Moving dates
+    is not a check-off, so the change feed is paused while a batch is written.
+
+    Args:
+        db_name (str): The main database file.
+        horizon_days (int): Completions more than this many days old are archived.
+        today (date, optional): The reference date. Defaults to today.
+        batch_size (int): The number of habits moved per transaction.
+
+    Returns:
+        dict: The number of habits touched and completions archived.
+    """
+    cutoff = (today or date.today()) - timedelta(days=horizon_days)
+    cutoff_ordinal = cutoff.toordinal()
+    habits_touched = 0
+    archived = 0
+    conn = sqlite3.connect(db_name, timeout=Habit._BUSY_TIMEOUT, isolation_level=None)
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path(db_name),))
+        create_archive_tables(conn)
+        last_rowid = 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            paused = pause_change_feed(conn)
+            rows = conn.execute(
+                """SELECT rowid, name, completed_dates FROM habit WHERE rowid > ? ORDER BY rowid LIMIT ?""",
+                (last_rowid, batch_size)).fetchall()
+            for rowid, name, completed_dates in rows:
+                dates = json.loads(completed_dates) if completed_dates else []
+                cold = [d for d in dates if date_ordinal(d) < cutoff_ordinal]
+                if not cold:
+                    continue
+                hot = [d for d in dates if date_ordinal(d) >= cutoff_ordinal]
+                cold = sorted({date.fromordinal(date_ordinal(d)).isoformat() for d in cold})
+                conn.executemany("INSERT OR IGNORE INTO archive.completion (name, completed_date) VALUES (?,?)",
+                                 [(name, d) for d in cold])
+                conn.execute("UPDATE habit SET completed_dates = ? WHERE rowid = ?", (json.dumps(hot), rowid))
+                conn.execute(
+                    """INSERT OR REPLACE INTO habit_archive (name, archived_count, first_date, last_date)
+                       SELECT ?, COUNT(*), MIN(completed_date), MAX(completed_date) FROM archive.completion WHERE name = ?""",
+                    (name, name))
+                habits_touched += 1
+                archived += len(cold)
+            if paused:
+                resume_change_feed(conn)
+            conn.execute("COMMIT")
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+        conn.execute("DETACH DATABASE archive")
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        conn.close()
+    return {'habits': habits_touched, 'archived': archived, 'cutoff': cutoff.isoformat()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move old completions into the archive database.")
+    parser.add_argument('--db', default='main.db', help="Database file (default: main.db)")
+    parser.add_argument('--horizon-days', type=int, default=90, help="Archive completions older than this (default: 90)")
+    parser.add_argument('--batch-size', type=int, default=200, help="Habits moved per transaction")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = archive_cold_history(args.db, args.horizon_days, batch_size=args.batch_size)
+    print(f"Archived {result['archived']} completions older than {result['cutoff']} "
+          f"from {result['habits']} habits into {archive_path(args.db)} "
+          f"in {time.perf_counter() - started:.2f}s")
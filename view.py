@@ -1,6 +1,19 @@
+import argparse
+import csv
+import gzip
+import io
 import sqlite3
+import sys
+
+from db import attach_archive, full_history_sql
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'ndjson')  # jsonl and ndjson are the same line-delimited format
+CHUNK_SIZE = 5000  # Rows fetched from SQLite per fetchmany() call
+WRITE_BUFFER = 1 << 20  # 1 MiB write buffer for the output file
+
 
 def print_table_data(db, table):
+    conn = None
     try:
         # Connect to the SQLite database
         conn = sqlite3.connect(db)
@@ -10,9 +23,6 @@ def print_table_data(db, table):
         query = f"SELECT * FROM {table}"
         cursor.execute(query)
 
-        # Fetch all rows
-        rows = cursor.fetchall()
-
         # Fetch column names
         column_names = [description[0] for description in cursor.description]
 
@@ -22,9 +32,10 @@ def print_table_data(db, table):
         print(" | ".join(column_names))
         print("-" * 120)
 
-        # Print rows
-        for row in rows:
-            print(" | ".join(map(str, row)))
+        # Print rows chunk by chunk instead of holding the whole table in memory
+        for rows in iter_chunks(cursor):
+            for row in rows:
+                print(" | ".join(map(str, row)))
 
     except sqlite3.Error as e:
         print(f"Error: {e}")
@@ -32,4 +43,195 @@ def print_table_data(db, table):
         if conn:
             conn.close()
 
-print_table_data('main.db', 'habit')
\ No newline at end of file
+
+def iter_chunks(cursor, chunk_size=CHUNK_SIZE):
+    """
+    Yield the rows of an executed cursor in chunks using fetchmany().
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor on which a SELECT has been executed.
+        chunk_size (int): The number of rows fetched per call.
+
+    Yields:
+        list: A list of at most chunk_size rows.
+    """
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+
+def table_columns(conn, table):
+    """
+    Return the column names of a table, or raise ValueError if it does not exist.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+        table (str): The table name.
+
+    Returns:
+        list: The column names in table order.
+    """
+    columns = [row[1] for row in conn.execute("SELECT * FROM pragma_table_info(?)", (table,))]
+    if not columns:
+        raise ValueError(f"Unknown table: {table}")
+    return columns
+
+
+def build_export_query(conn, table, columns=None, completions=False, fmt='csv', with_archive=False):
+    """
+    Build the SELECT statement for an export, projecting only the requested columns.
+
+    Table and column names are checked against the schema before being
+    placed in the statement, since they cannot be bound as parameters.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+        table (str): The table to export.
+        columns (list, optional): The columns to export. Defaults to every column.
+        completions (bool): If True, export one row per completed date instead of one row per habit.
+        fmt (str): One of EXPORT_FORMATS. JSON formats are encoded by SQLite with json_object(),
+            so each result row is a single ready-to-write line.
+        with_archive (bool): Include the completions tiering.py moved to the archive database,
+            which must be attached as 'archive'.
+
+    Returns:
+        tuple: The SQL statement and the list of exported column names.
+    """
+    available = table_columns(conn, table)
+    if completions:
+        available = [c for c in available if c.lower() != 'completed_dates'] + ['completed_date']
+    if columns is None:
+        columns = list(available)
+    unknown = [c for c in columns if c not in available]
+    if unknown:
+        raise ValueError(f"Unknown column(s) for {table}: {', '.join(unknown)}")
+
+    def select(completed_date):
+        expressions = [completed_date if c == 'completed_date' else f't."{c}"' for c in columns]
+        if with_archive and not completions:
+            # printf() keeps the merged list a plain string, as the stored column is exported
+            expressions = [f"printf('%s', {full_history_sql('t')})" if c.lower() == 'completed_dates' else e
+                           for c, e in zip(columns, expressions)]
+        if fmt != 'csv':
+            pairs = ", ".join("'{}', {}".format(c.replace("'", "''"), e) for c, e in zip(columns, expressions))
+            expressions = [f'json_object({pairs})']
+        return f'SELECT {", ".join(expressions)} FROM "{table}" AS t'
+
+    query = select('j.value')
+    if completions:  # Expand the JSON list in SQLite so the dates never pass through Python as one big list
+        query += ', json_each(t.completed_dates) AS j WHERE json_valid(t.completed_dates)'
+        if with_archive:    # Archived completions are rows of their own in the archive database
+            query += ' UNION ALL ' + select('a.completed_date') + ' JOIN archive.completion AS a ON a.name = t.name'
+    return query, columns
+
+
+def open_export_file(path, compress=False):
+    """
+    Open a buffered text writer for an export, optionally gzip-compressed.
+
+    Args:
+        path (str): The output path, or '-' for standard output.
+        compress (bool): Whether to gzip the output.
+
+    Returns:
+        io.TextIOWrapper: A text stream to write the export to.
+    """
+    if path == '-':
+        raw = sys.stdout.buffer
+        if compress:  # GzipFile writes its trailer on close without closing stdout
+            raw = io.BufferedWriter(gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6), WRITE_BUFFER)
+    elif compress:
+        raw = io.BufferedWriter(gzip.open(path, 'wb', compresslevel=6), WRITE_BUFFER)
+    else:
+        raw = open(path, 'wb', buffering=WRITE_BUFFER)
+    return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+
+
+def write_rows(out, fmt, column_names, chunks):
+    """
+    Write chunks of rows to a text stream in the requested format.
+
+    Args:
+        out (io.TextIOBase): The stream to write to.
+        fmt (str): One of EXPORT_FORMATS.
+        column_names (list): The names of the exported columns, used as the CSV header.
+        chunks (iterable): An iterable of row lists, as produced by iter_chunks().
+
+    Returns:
+        int: The number of rows written.
+    """
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(column_names)
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+    else:
+        for rows in chunks:  # Each row is a single JSON object built by SQLite
+            out.write("\n".join([row[0] for row in rows]))
+            out.write("\n")
+            count += len(rows)
+    return count
+
+
+def export_table_data(db, table, path, fmt='csv', columns=None, completions=False,
+                      compress=False, chunk_size=CHUNK_SIZE):
+    """
+    Stream a table to CSV, JSONL or NDJSON without loading it into memory.
+
+    Args:
+        db (str): The SQLite database file.
+        table (str): The table to export.
+        path (str): The output file, or '-' for standard output.
+        fmt (str): One of 'csv', 'jsonl' or 'ndjson'.
+        columns (list, optional): The columns to export. Defaults to every column.
+        completions (bool): If True, export one row per completed date.
+            Completions in the archive database are included for the habit table.
+        compress (bool): Whether to gzip the output.
+        chunk_size (int): The number of rows fetched from SQLite at a time.
+
+    Returns:
+        int: The number of rows written.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    with sqlite3.connect(db) as conn:
+        with_archive = table == 'habit' and attach_archive(conn, db)
+        query, column_names = build_export_query(conn, table, columns, completions, fmt, with_archive)
+        cursor = conn.execute(query)
+        out = open_export_file(path, compress)
+        try:
+            count = write_rows(out, fmt, column_names, iter_chunks(cursor, chunk_size))
+        finally:
+            if path == '-' and not compress:
+                out.flush()
+                out.detach()  # Leave stdout open
+            else:
+                out.close()
+    return count
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="View or export the habit database.")
+    parser.add_argument('--db', default='main.db', help="Database file (default: main.db)")
+    parser.add_argument('--table', default='habit', help="Table to view or export (default: habit)")
+    parser.add_argument('--export', metavar='PATH', help="Export to PATH ('-' for stdout) instead of printing")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help="Export format (default: csv)")
+    parser.add_argument('--columns', help="Comma-separated list of columns to export")
+    parser.add_argument('--completions', action='store_true', help="Export one row per completed date")
+    parser.add_argument('--gzip', action='store_true', help="Gzip the export")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows fetched per batch")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.export:
+        columns = args.columns.split(',') if args.columns else None
+        export_table_data(args.db, args.table, args.export, args.format, columns,
+                          args.completions, args.gzip, args.chunk_size)
+    else:
+        print_table_data(args.db, args.table)